@@ -1,18 +1,28 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import uuid
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy.sql import func
 
-from core.embeddings import embed_texts
-from core.vectorstore import query_documents
-from core.llm import generate_answer, generate_title
+from core.answer_cache import answer_cache
+from core.embeddings import embed_texts_async
+from core.tokens import count_tokens
+from services.context_builder import build_context
+from services.deletion import deleted_documents
+from services.reranker import RERANK_CANDIDATES, RERANK_TOP_K, reranker
+from services.retriever import hybrid_search
+from core.llm import generate_answer_async, generate_title_async, stream_answer
 from fastapi import Depends
-from core.deps import get_current_user
-from models.user import User
+from core.deps import Principal, get_current_user
 from core.rate_limiter import rate_limiter
 from core.database import SessionLocal
 from models.conversation import Conversation, Message
 from typing import Optional
 
-
 router = APIRouter(prefix="/api/ask", tags=["ask"])
 
 
@@ -21,114 +31,340 @@ class AskRequest(BaseModel):
     conversation_id: Optional[str] = None
 
 
-@router.post("")
-async def ask_question(
-    payload: AskRequest, current_user: User = Depends(get_current_user)
-):
-    if not rate_limiter.check(current_user.id, "ask"):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+def _conversation_exists(user_id: str, conversation_id: Optional[str]) -> bool:
+    if not conversation_id:
+        return False
 
-    if not payload.question.strip():
-        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    db = SessionLocal()
+    try:
+        conversation = (
+            db.query(Conversation.id)
+            .filter(
+                Conversation.id == conversation_id,
+                Conversation.user_id == user_id,
+            )
+            .first()
+        )
+        return conversation is not None
+    finally:
+        db.close()
+
+
+def _placeholder_title(question: str) -> str:
+    """Shown until the generated title lands."""
+    title = " ".join(question.split())
+    return title if len(title) <= 50 else title[:50].rstrip() + "..."
+
+
+def _create_conversation(user_id: str, conversation_id: str, question: str):
+    db = SessionLocal()
+    try:
+        db.add(
+            Conversation(
+                id=conversation_id,
+                user_id=user_id,
+                title=_placeholder_title(question),
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _save_messages(conversation_id: str, question: str, answer: str):
+    """Store the question/answer pair and mark the conversation active."""
+    db = SessionLocal()
+    try:
+        # Listings show the most recently active conversations first
+        db.query(Conversation).filter(Conversation.id == conversation_id).update(
+            {Conversation.updated_at: func.now()}, synchronize_session=False
+        )
+
+        # Save User Message
+        db.add(Message(conversation_id=conversation_id, role="user", content=question))
 
-    query_embedding = embed_texts([payload.question])[0]
+        # Save Assistant Message
+        db.add(
+            Message(conversation_id=conversation_id, role="assistant", content=answer)
+        )
 
-    results = query_documents(
-        query_embedding=query_embedding, n_results=6, where={"user_id": current_user.id}
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _set_title(conversation_id: str, title: str):
+    db = SessionLocal()
+    try:
+        db.query(Conversation).filter(Conversation.id == conversation_id).update(
+            {Conversation.title: title}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+NO_ANSWER = "I don't know based on the provided information."
+
+
+async def _retrieve(
+    question: str, query_embedding, user_id: str
+) -> tuple[str, list[str], int]:
+    """
+    Fetch the chunks matching the question (hybrid vector + keyword),
+    rerank them down to a diverse few and assemble the context.
+    Returns (context, sources, prompt_tokens_saved), the last compared
+    with sending the top RERANK_TOP_K retrieved chunks unfiltered.
+    """
+    results = await hybrid_search(
+        question,
+        query_embedding,
+        user_id,
+        top_k=RERANK_CANDIDATES,
+        include_values=True,
     )
+    candidates = [match for match in results["matches"] if "text" in match["metadata"]]
 
-    # documents = results.get("documents", [[]])[0]
-    # metadatas = results.get("metadatas", [[]])[0]
+    # Vectors of a deleted document linger until the background purge ends
+    deleted = await run_in_threadpool(
+        deleted_documents,
+        [match["metadata"].get("document_id") for match in candidates],
+    )
+    if deleted:
+        candidates = [
+            match
+            for match in candidates
+            if match["metadata"].get("document_id") not in deleted
+        ]
 
-    # Pinecone
-    matches = results["matches"]
-    documents = [
-        match["metadata"]["text"] for match in matches if "text" in match["metadata"]
-    ]
+    # NumPy scoring and embedding cache lookups: keep them off the loop
+    matches = await run_in_threadpool(
+        reranker.rerank, question, query_embedding, candidates
+    )
+    context = build_context(matches)
     metadatas = [match["metadata"] for match in matches]
 
     sources = list({meta.get("source") for meta in metadatas if meta.get("source")})
 
-    # return {"question": payload.question, "matches": documents}
+    unranked = [match["metadata"]["text"] for match in candidates[:RERANK_TOP_K]]
+    saved = count_tokens("\n\n".join(unranked)) - count_tokens(context)
 
-    # 3️⃣ Fallback retrieval (wider net)
-    if not documents:
-        results = query_documents(
-            query_embedding=query_embedding,
-            n_results=12,
-            where={"user_id": current_user.id},
-        )
-        # documents = results.get("documents", [[]])[0]
-        matches = results["matches"]
-        documents = [
-            match["metadata"]["text"]
-            for match in matches
-            if "text" in match["metadata"]
-        ]
+    return context, sources, saved
 
-    # 4️⃣ Give up only if still nothing
-    if not documents:
-        answer = "I don't know based on the provided information."
-        sources = []
-    else:
-        context = "\n\n".join(documents)
-        answer = generate_answer(context, payload.question)
 
-    # 4️⃣ Save Conversation & Messages
-    db = SessionLocal()
+async def _resolve_conversation(
+    lookup: asyncio.Task, user_id: str, conversation_id: Optional[str], question: str
+) -> tuple[str, bool]:
+    """
+    Returns (conversation_id, is_new). Unknown or foreign ids start a new
+    conversation, created here with a placeholder title so that the id
+    handed back is usable for a follow-up straight away.
+    """
     try:
-        # Get or Create Conversation
-        conversation_id = payload.conversation_id
-        if conversation_id:
-            conversation = (
-                db.query(Conversation)
-                .filter(
-                    Conversation.id == conversation_id,
-                    Conversation.user_id == current_user.id,
-                )
-                .first()
-            )
-            # If not found (e.g. invalid ID), create new
-            if not conversation:
-                # Generate Smart Title
-                title = generate_title(payload.question)
-                conversation = Conversation(user_id=current_user.id, title=title)
-                db.add(conversation)
-                db.commit()
-                db.refresh(conversation)
-                conversation_id = conversation.id
-        else:
+        exists = await lookup
+    except Exception as e:
+        print(f"Error looking up conversation: {e}")
+        exists = False
+
+    if exists:
+        return conversation_id, False
+
+    conversation_id = str(uuid.uuid4())
+    await run_in_threadpool(_create_conversation, user_id, conversation_id, question)
+    return conversation_id, True
+
+
+async def _persist(conversation_id: str, is_new: bool, question: str, answer: str):
+    """
+    Write-behind step, run after the response is sent: save the messages,
+    then replace the placeholder title of a new conversation. Failures are
+    logged; the user already has their answer.
+    """
+    try:
+        await run_in_threadpool(_save_messages, conversation_id, question, answer)
+    except Exception as e:
+        print(f"Error saving conversation: {e}")
+        return
+
+    if is_new:
+        try:
             # Generate Smart Title
-            title = generate_title(payload.question)
-            conversation = Conversation(user_id=current_user.id, title=title)
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
-            conversation_id = conversation.id
+            title = await generate_title_async(question)
+            await run_in_threadpool(_set_title, conversation_id, title)
+        except Exception as e:
+            print(f"Error generating conversation title: {e}")
 
-        # Save User Message
-        user_msg = Message(
-            conversation_id=conversation_id, role="user", content=payload.question
+
+async def _check_request(payload: AskRequest, current_user: Principal):
+    if not await rate_limiter.check_async(current_user.id, "ask"):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+    if not payload.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+
+def _start_lookup(payload: AskRequest, current_user: Principal) -> asyncio.Task:
+    """Conversation lookup runs alongside retrieval, not after it."""
+    return asyncio.create_task(
+        run_in_threadpool(
+            _conversation_exists, current_user.id, payload.conversation_id
         )
-        db.add(user_msg)
+    )
 
-        # Save Assistant Message
-        ai_msg = Message(
-            conversation_id=conversation_id, role="assistant", content=answer
+
+@router.post("")
+async def ask_question(
+    payload: AskRequest,
+    background_tasks: BackgroundTasks,
+    current_user: Principal = Depends(get_current_user),
+):
+    await _check_request(payload, current_user)
+
+    lookup = _start_lookup(payload, current_user)
+    query_embedding = (await embed_texts_async([payload.question]))[0]
+
+    cached = answer_cache.lookup(current_user.id, query_embedding)
+    prompt_tokens_saved = 0
+    if cached:
+        answer, sources = cached["answer"], cached["sources"]
+    else:
+        generation = answer_cache.generation(current_user.id)
+        context, sources, prompt_tokens_saved = await _retrieve(
+            payload.question, query_embedding, current_user.id
         )
-        db.add(ai_msg)
 
-        db.commit()
+        if not context:
+            answer = NO_ANSWER
+        else:
+            answer = await generate_answer_async(context, payload.question)
 
-    except Exception as e:
-        print(f"Error saving conversation: {e}")
-        # Don't fail the request just because saving failed
-    finally:
-        db.close()
+        answer_cache.store(
+            current_user.id,
+            payload.question,
+            query_embedding,
+            answer,
+            sources,
+            generation,
+        )
+
+    conversation_id, is_new = await _resolve_conversation(
+        lookup, current_user.id, payload.conversation_id, payload.question
+    )
+    background_tasks.add_task(
+        _persist, conversation_id, is_new, payload.question, answer
+    )
 
-    return {
+    response = {
         "question": payload.question,
         "answer": answer,
         "sources": sources,
         "conversation_id": conversation_id,
+        "cached": cached is not None,
+        "prompt_tokens_saved": prompt_tokens_saved,
     }
+    if is_new:
+        response["title"] = _placeholder_title(payload.question)
+    return response
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/stream")
+async def ask_question_stream(
+    payload: AskRequest, current_user: Principal = Depends(get_current_user)
+):
+    """
+    Server-sent events version of /api/ask.
+
+    Emits `sources` (with the conversation id) once retrieval finishes,
+    then one `token` event per answer delta, then `done`. Messages are
+    saved after the stream closes. Failures mid-stream are reported as an
+    `error` event.
+    """
+    await _check_request(payload, current_user)
+
+    lookup = _start_lookup(payload, current_user)
+    background_tasks = BackgroundTasks()
+
+    async def events():
+        try:
+            query_embedding = (await embed_texts_async([payload.question]))[0]
+
+            cached = answer_cache.lookup(current_user.id, query_embedding)
+            prompt_tokens_saved = 0
+            if cached:
+                context, sources = None, cached["sources"]
+            else:
+                generation = answer_cache.generation(current_user.id)
+                context, sources, prompt_tokens_saved = await _retrieve(
+                    payload.question, query_embedding, current_user.id
+                )
+
+            conversation_id, is_new = await _resolve_conversation(
+                lookup, current_user.id, payload.conversation_id, payload.question
+            )
+
+            started = {"sources": sources, "conversation_id": conversation_id}
+            if is_new:
+                started["title"] = _placeholder_title(payload.question)
+            yield _sse("sources", started)
+
+            if cached:
+                answer = cached["answer"]
+                yield _sse("token", {"text": answer})
+            elif not context:
+                answer = NO_ANSWER
+                yield _sse("token", {"text": answer})
+            else:
+                parts = []
+                async for delta in stream_answer(context, payload.question):
+                    parts.append(delta)
+                    yield _sse("token", {"text": delta})
+                answer = "".join(parts).strip()
+
+            if not cached:
+                answer_cache.store(
+                    current_user.id,
+                    payload.question,
+                    query_embedding,
+                    answer,
+                    sources,
+                    generation,
+                )
+
+            # Runs once the response body is complete
+            background_tasks.add_task(
+                _persist,
+                conversation_id,
+                is_new,
+                payload.question,
+                answer,
+            )
+            yield _sse(
+                "done",
+                {
+                    "question": payload.question,
+                    "answer": answer,
+                    "sources": sources,
+                    "conversation_id": conversation_id,
+                    "cached": cached is not None,
+                    "prompt_tokens_saved": prompt_tokens_saved,
+                },
+            )
+        except Exception as e:
+            print(f"Error streaming answer: {e}")
+            yield _sse("error", {"detail": "Failed to generate answer"})
+        finally:
+            lookup.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks,
+    )
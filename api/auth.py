@@ -1,11 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.orm import Session
 
 from core.database import SessionLocal
-from core.security import hash_password
+from core.security import (
+    HashingBusy,
+    hash_password_async,
+    needs_rehash,
+    verify_password_async,
+)
 from models.user import User
-from core.security import verify_password
 from core.jwt import create_access_token
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
@@ -22,24 +27,84 @@ class LoginRequest(BaseModel):
     password: str
 
 
-@router.post("/signup")
-def signup(payload: SignupRequest):
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many sign-in attempts, try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
+def _find_user(email: str) -> User | None:
+    db: Session = SessionLocal()
+    try:
+        return db.query(User).filter(User.email == email).first()
+    finally:
+        db.close()
+
+
+def _create_user(name: str, email: str, password_hash: str) -> User | None:
+    """Returns None when the email is already registered."""
+    db: Session = SessionLocal()
+    try:
+        # Check if email already exists
+        existing_user = db.query(User.id).filter(User.email == email).first()
+        if existing_user:
+            return None
+
+        user = User(name=name, email=email, password_hash=password_hash)
+
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user
+    finally:
+        db.close()
+
+
+def _set_password_hash(user_id: str, old_hash: str, new_hash: str):
     db: Session = SessionLocal()
+    try:
+        user = (
+            db.query(User)
+            .filter(User.id == user_id, User.password_hash == old_hash)
+            .first()
+        )
+        # Password changed meanwhile: keep the newer one
+        if user is not None:
+            user.password_hash = new_hash
+            db.commit()
+    finally:
+        db.close()
+
+
+async def _rehash(user_id: str, old_hash: str, password: str):
+    """Upgrade a hash made with an old BCRYPT_ROUNDS after a login."""
+    try:
+        new_hash = await hash_password_async(password)
+        await run_in_threadpool(_set_password_hash, user_id, old_hash, new_hash)
+    except HashingBusy:
+        pass  # Retried on the next login
+    except Exception as e:
+        print(f"Error rehashing password: {e}")
+
 
-    # Check if email already exists
-    existing_user = db.query(User).filter(User.email == payload.email).first()
-    if existing_user:
+@router.post("/signup")
+async def signup(payload: SignupRequest):
+    # Cheap check first so taken emails don't cost a hash
+    if await run_in_threadpool(_find_user, payload.email):
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    user = User(
-        name=payload.name,
-        email=payload.email,
-        password_hash=hash_password(payload.password),
-    )
+    try:
+        password_hash = await hash_password_async(payload.password)
+    except HashingBusy:
+        raise _busy()
 
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    user = await run_in_threadpool(
+        _create_user, payload.name, payload.email, password_hash
+    )
+    if user is None:
+        raise HTTPException(status_code=400, detail="Email already registered")
 
     return {
         "message": "User created successfully",
@@ -50,16 +115,23 @@ def signup(payload: SignupRequest):
 
 
 @router.post("/login")
-def login(payload: LoginRequest):
-    db: Session = SessionLocal()
-
-    user = db.query(User).filter(User.email == payload.email).first()
+async def login(payload: LoginRequest, background_tasks: BackgroundTasks):
+    user = await run_in_threadpool(_find_user, payload.email)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    if not verify_password(payload.password, user.password_hash):
+    try:
+        valid = await verify_password_async(payload.password, user.password_hash)
+    except HashingBusy:
+        raise _busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    if needs_rehash(user.password_hash):
+        background_tasks.add_task(
+            _rehash, user.id, user.password_hash, payload.password
+        )
+
     access_token = create_access_token(data={"sub": str(user.id)})
 
     return {"access_token": access_token, "user": user, "token_type": "bearer"}
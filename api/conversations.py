@@ -1,49 +1,82 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session, joinedload
-from core.database import SessionLocal
-from core.deps import get_current_user
-from models.user import User
-from models.conversation import Conversation
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from sqlalchemy.orm import Session
+from core.database import get_db
+from core.deps import Principal, get_current_user
+from core.pagination import MAX_PAGE_SIZE, PAGE_SIZE, InvalidCursor, keyset_page
+from models.conversation import Conversation, Message
 
 router = APIRouter(prefix="/api/conversations", tags=["conversations"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def _conversation(row) -> dict:
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "title": row.title,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
+    }
+
+
+CONVERSATION_COLUMNS = (
+    Conversation.id,
+    Conversation.user_id,
+    Conversation.title,
+    Conversation.created_at,
+    Conversation.updated_at,
+)
 
 
 @router.get("")
 def list_conversations(
-    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
     """
-    List all conversations for the authenticated user, ordered by most recent.
+    List the authenticated user's conversations, most recently active
+    first, one page at a time. When there are more, the X-Next-Cursor
+    header holds the `cursor` for the next page.
     """
-    conversations = (
-        db.query(Conversation)
-        .filter(Conversation.user_id == current_user.id)
-        .order_by(Conversation.updated_at.desc())
-        .all()
+    query = db.query(*CONVERSATION_COLUMNS).filter(
+        Conversation.user_id == current_user.id
     )
-    return conversations
+    try:
+        rows, next_cursor = keyset_page(
+            query,
+            Conversation.updated_at,
+            Conversation.id,
+            cursor,
+            limit,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [_conversation(row) for row in rows]
 
 
 @router.get("/{conversation_id}")
 def get_conversation(
     conversation_id: str,
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
-    Get a specific conversation and its messages.
+    Get a conversation with its latest `limit` messages, oldest first.
+    X-Next-Cursor, when present, is the `cursor` for the messages before
+    these.
     """
     conversation = (
-        db.query(Conversation)
-        .options(joinedload(Conversation.messages))
+        db.query(*CONVERSATION_COLUMNS)
         .filter(
             Conversation.id == conversation_id, Conversation.user_id == current_user.id
         )
@@ -52,13 +85,41 @@ def get_conversation(
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    return conversation
+    query = db.query(
+        Message.id,
+        Message.conversation_id,
+        Message.role,
+        Message.content,
+        Message.created_at,
+    ).filter(Message.conversation_id == conversation_id)
+    try:
+        rows, next_cursor = keyset_page(
+            query, Message.created_at, Message.id, cursor, limit
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return {
+        **_conversation(conversation),
+        "messages": [
+            {
+                "id": row.id,
+                "conversation_id": row.conversation_id,
+                "role": row.role,
+                "content": row.content,
+                "created_at": row.created_at,
+            }
+            for row in reversed(rows)
+        ],
+    }
 
 
 @router.delete("/{conversation_id}")
 def delete_conversation(
     conversation_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
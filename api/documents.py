@@ -1,68 +1,90 @@
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from core.database import SessionLocal
-from core.deps import get_current_user
-from models.user import User
+from core.database import get_db
+from core.deps import Principal, get_current_user
+from core.pagination import MAX_PAGE_SIZE, PAGE_SIZE, InvalidCursor, keyset_page
 from models.document import Document
-from core.vectorstore import delete_vectors
+from core.answer_cache import answer_cache
+from services.deletion import purge_document, tombstone_document
+from services.ingest import DocumentBusy
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get("")
 def list_documents(
-    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
     """
-    List all documents (both files and text) uploaded by the user.
+    List the documents (both files and text) uploaded by the user, newest
+    first, one page at a time. When there are more, the X-Next-Cursor
+    header holds the `cursor` for the next page.
     """
-    documents = (
-        db.query(Document)
-        .filter(Document.user_id == current_user.id)
-        .order_by(Document.created_at.desc())
-        .all()
-    )
-    return documents
+    query = db.query(
+        Document.id,
+        Document.user_id,
+        Document.filename,
+        Document.file_type,
+        Document.content_hash,
+        Document.created_at,
+    ).filter(Document.user_id == current_user.id, Document.deleted_at.is_(None))
+    try:
+        rows, next_cursor = keyset_page(
+            query, Document.created_at, Document.id, cursor, limit
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [
+        {
+            "id": row.id,
+            "user_id": row.user_id,
+            "filename": row.filename,
+            "file_type": row.file_type,
+            "content_hash": row.content_hash,
+            "created_at": row.created_at,
+        }
+        for row in rows
+    ]
 
-@router.delete("/{document_id}")
-def delete_document(
+
+@router.delete("/{document_id}", status_code=202)
+async def delete_document(
     document_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    current_user: Principal = Depends(get_current_user),
 ):
     """
-    Delete a document AND its associated vectors from Pinecone.
+    Delete a document. It disappears at once; its vectors are removed by
+    id in the background, after the response.
     """
-    # 1. Check if document exists and belongs to user
-    document = (
-        db.query(Document)
-        .filter(Document.id == document_id, Document.user_id == current_user.id)
-        .first()
-    )
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
-
-    # 2. Delete vectors from Pinecone using the document_id filter
     try:
-        delete_vectors(filter={"document_id": document_id})
-    except Exception as e:
-        # Log this, but maybe proceed to delete from DB or raise?
-        # For now, let's assume if vector delete fails, we shouldn't delete the DB record to avoid 'phantom' vectors.
+        deleted = await run_in_threadpool(
+            tombstone_document, current_user.id, document_id
+        )
+    except DocumentBusy:
         raise HTTPException(
-            status_code=500, detail=f"Failed to delete vectors: {str(e)}"
+            status_code=409, detail="The document is still being processed"
         )
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    background_tasks.add_task(purge_document, current_user.id, document_id)
 
-    # 3. Delete from Database
-    db.delete(document)
-    db.commit()
+    # Cached answers may cite the deleted document
+    answer_cache.invalidate_user(current_user.id)
 
-    return {"message": "Document deleted successfully", "id": document_id}
+    return {
+        "message": "Document deleted successfully",
+        "id": document_id,
+        "status": "deleting",
+    }
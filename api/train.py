@@ -1,79 +1,284 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+import os
 import uuid
-from services.text_splitter import split_text
-from core.embeddings import embed_texts
-from core.vectorstore import add_documents
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.sql import func
+from pydantic import BaseModel, ValidationError
+from services.text_splitter import iter_chunks
+from core.embeddings import embed_texts_async
+from core.vectorstore import add_documents_async
+from core.answer_cache import answer_cache
+from services.dedup import chunk_deduplicator
 from fastapi import Depends
-from core.deps import get_current_user
-from models.user import User
+from core.deps import Principal, get_current_user
 from core.rate_limiter import rate_limiter
 from core.database import SessionLocal
 from models.document import Document
-
+from api.train_file import enqueue_upload
+from services.deletion import purge_document
 
 router = APIRouter(prefix="/api/train", tags=["train"])
 
+# Texts plus files in one /batch request
+TRAIN_BATCH_MAX_ITEMS = int(os.getenv("TRAIN_BATCH_MAX_ITEMS", "1000"))
+
 
 class TrainTextRequest(BaseModel):
     text: str
 
 
-# ... (imports)
+class TrainBatchRequest(BaseModel):
+    texts: list[str]
 
 
-@router.post("/text")
-async def train_text(
-    payload: TrainTextRequest,
-    current_user: User = Depends(get_current_user),
-):
-    if not rate_limiter.check(current_user.id, "train"):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+def _text_document(user_id: str, text: str) -> Document:
+    snippet = text[:50].replace("\n", " ").strip() + "..."
+    return Document(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        filename=f"Text: {snippet}",
+        file_type="text",
+    )
 
-    if not payload.text.strip():
-        raise HTTPException(status_code=400, detail="Text cannot be empty")
 
-    # 1. Create Document record
-    snippet = payload.text[:50].replace("\n", " ").strip() + "..."
-    doc_entry = Document(
-        user_id=current_user.id, filename=f"Text: {snippet}", file_type="text"
-    )
+def _chunk_metadata(user_id: str, document_id: str, chunk: dict) -> dict:
+    return {
+        "user_id": user_id,
+        "source": "text",  # Kept for backward compat if needed
+        "document_id": document_id,  # New Link
+        # Already added in vectorstore.py but explicitly good here too
+        "text": chunk["text"],
+        "chunk_index": chunk["chunk_index"],
+        "paragraph": chunk["paragraph"],
+    }
 
+
+def _create_document(doc_entry: Document) -> Document:
     db = SessionLocal()
     try:
         db.add(doc_entry)
         db.commit()
         db.refresh(doc_entry)
+        return doc_entry
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         db.close()
 
-    # 2. Process Vectors
-    chunks = split_text(payload.text)
-    embeddings = embed_texts(chunks)
-
-    ids = [str(uuid.uuid4()) for _ in chunks]
-    metadatas = [
-        {
-            "user_id": current_user.id,
-            "source": "text",  # Kept for backward compat if needed
-            "document_id": doc_entry.id,  # New Link
-            "text": chunk,  # Already added in vectorstore.py but explicitly good here too
-        }
-        for chunk in chunks  # FIX: iterate over chunks, not range if we want the actual chunk text available easily here
-    ]
 
-    add_documents(
-        texts=chunks,
-        embeddings=embeddings,
-        metadatas=metadatas,
-        ids=ids,
+def _create_documents(documents: list[Document]):
+    """All or nothing, in one transaction."""
+    db = SessionLocal()
+    try:
+        db.add_all(documents)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+
+def _tombstone_documents(document_ids: list[str]):
+    db = SessionLocal()
+    try:
+        db.query(Document).filter(Document.id.in_(document_ids)).update(
+            {Document.deleted_at: func.now()}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _discard_documents(user_id: str, document_ids: list[str]):
+    """
+    Undo texts whose vectors failed to store. Some batches may already be
+    upserted, so the documents go through the deletion purge, which
+    removes them by chunk id; a purge that fails leaves the tombstone for
+    the next startup to retry.
+    """
+    await run_in_threadpool(_tombstone_documents, document_ids)
+    for document_id in document_ids:
+        await purge_document(user_id, document_id)
+
+
+def _chunk_texts(texts: list[str]) -> list[list[dict]]:
+    return [list(iter_chunks([(text, None)])) for text in texts]
+
+
+async def _read_batch(request: Request) -> tuple[list[str], list]:
+    """(texts, files) from a JSON {"texts": [...]} or multipart body."""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form(
+            max_files=TRAIN_BATCH_MAX_ITEMS, max_fields=TRAIN_BATCH_MAX_ITEMS
+        )
+        texts = [value for value in form.getlist("texts") if isinstance(value, str)]
+        files = [value for value in form.getlist("files") if not isinstance(value, str)]
+        return texts, files
+
+    try:
+        payload = TrainBatchRequest.model_validate(await request.json())
+    except (ValueError, ValidationError):
+        raise HTTPException(
+            status_code=422,
+            detail='Send JSON {"texts": [...]} or multipart "texts"/"files" fields',
+        )
+    return payload.texts, []
+
+
+@router.post("/text")
+async def train_text(
+    payload: TrainTextRequest,
+    current_user: Principal = Depends(get_current_user),
+):
+    if not await rate_limiter.check_async(current_user.id, "train"):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+    if not payload.text.strip():
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+
+    # 1. Create Document record
+    doc_entry = _text_document(current_user.id, payload.text)
+    doc_entry = await run_in_threadpool(_create_document, doc_entry)
+
+    # 2. Process Vectors
+    [chunks] = await run_in_threadpool(_chunk_texts, [payload.text])
+    # Near-duplicates of what the user already stored are not embedded again
+    kept, skipped = await run_in_threadpool(
+        chunk_deduplicator.register, current_user.id, doc_entry.id, chunks
     )
 
+    if kept:
+        texts = [chunk["text"] for chunk in kept]
+        try:
+            embeddings = await embed_texts_async(texts)
+
+            ids = [chunk["id"] for chunk in kept]
+            metadatas = [
+                _chunk_metadata(current_user.id, doc_entry.id, chunk) for chunk in kept
+            ]
+
+            await add_documents_async(
+                texts=texts,
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=ids,
+            )
+        except Exception:
+            await _discard_documents(current_user.id, [doc_entry.id])
+            raise
+    # Cached answers may be missing the new knowledge
+    answer_cache.invalidate_user(current_user.id)
+
     return {
         "message": "Text stored successfully",
         "document_id": doc_entry.id,
-        "chunks_stored": len(chunks),
+        "chunks_stored": len(kept),
+        "chunks_skipped": skipped,
+    }
+
+
+@router.post("/batch")
+async def train_batch(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    Train on many items in one request: a JSON body {"texts": [...]}, or
+    multipart with repeated "texts" fields and "files" uploads.
+
+    All text documents are created in one transaction and their chunks
+    share embedding requests and one upsert; files are queued for
+    ingestion as with /api/train_file/file. Counts as one training call
+    for rate limiting. Returns a result per text and per file, in order.
+    """
+    if not await rate_limiter.check_async(current_user.id, "train"):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+    texts, files = await _read_batch(request)
+    if not texts and not files:
+        raise HTTPException(status_code=400, detail="Batch cannot be empty")
+    if len(texts) + len(files) > TRAIN_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch can hold at most {TRAIN_BATCH_MAX_ITEMS} items",
+        )
+
+    text_results = [
+        {"index": i, "status": "failed", "error": "Text cannot be empty"}
+        for i in range(len(texts))
+    ]
+    positions = [i for i, text in enumerate(texts) if text.strip()]
+    stored = skipped = 0
+
+    if positions:
+        documents = [_text_document(current_user.id, texts[i]) for i in positions]
+        document_ids = [doc.id for doc in documents]  # expired by the commit
+        await run_in_threadpool(_create_documents, documents)
+
+        chunked = await run_in_threadpool(_chunk_texts, [texts[i] for i in positions])
+        # Near-duplicates, also across the items of this batch, are skipped
+        registered = await run_in_threadpool(
+            chunk_deduplicator.register_many,
+            current_user.id,
+            list(zip(document_ids, chunked)),
+        )
+        kept = [
+            (document_id, chunk)
+            for document_id, (chunks, _) in zip(document_ids, registered)
+            for chunk in chunks
+        ]
+
+        try:
+            if kept:
+                texts_to_embed = [chunk["text"] for _, chunk in kept]
+                embeddings = await embed_texts_async(texts_to_embed)
+                await add_documents_async(
+                    texts=texts_to_embed,
+                    embeddings=embeddings,
+                    metadatas=[
+                        _chunk_metadata(current_user.id, document_id, chunk)
+                        for document_id, chunk in kept
+                    ],
+                    ids=[chunk["id"] for _, chunk in kept],
+                )
+        except Exception as e:
+            print(f"Error storing batch embeddings: {e}")
+            await _discard_documents(current_user.id, document_ids)
+            for i in positions:
+                text_results[i]["error"] = "Failed to store embeddings"
+        else:
+            for i, document_id, (chunks, item_skipped) in zip(
+                positions, document_ids, registered
+            ):
+                text_results[i] = {
+                    "index": i,
+                    "status": "stored",
+                    "document_id": document_id,
+                    "chunks_stored": len(chunks),
+                    "chunks_skipped": item_skipped,
+                }
+                stored += len(chunks)
+                skipped += item_skipped
+
+    file_results = []
+    for i, file in enumerate(files):
+        try:
+            result = await enqueue_upload(file, current_user.id)
+        except HTTPException as e:
+            result = {"status": "failed", "error": e.detail}
+        file_results.append({"index": i, "filename": file.filename, **result})
+
+    if stored:
+        # Cached answers may be missing the new knowledge
+        answer_cache.invalidate_user(current_user.id)
+
+    return {
+        "message": "Batch processed",
+        "texts": text_results,
+        "files": file_results,
+        "chunks_stored": stored,
+        "chunks_skipped": skipped,
     }
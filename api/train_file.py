@@ -1,17 +1,22 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+import hashlib
 import os
 import uuid
-import shutil
-from services.file_loader import extract_text_from_file
-from services.text_splitter import split_text
-from core.embeddings import embed_texts
-from core.vectorstore import add_documents
-from core.deps import get_current_user
-from models.user import User
+from core.deps import Principal, get_current_user
 from core.rate_limiter import rate_limiter
-from core.database import SessionLocal
-from models.document import Document
-
+from core.database import get_db
+from models.ingest_job import IngestJob
+from services.ingest import (
+    DocumentBusy,
+    DocumentUnchanged,
+    QueueFullError,
+    create_job,
+    fail_job,
+    ingest_queue,
+)
 
 router = APIRouter(prefix="/api/train_file", tags=["train_file"])
 
@@ -25,64 +30,129 @@ ALLOWED_TYPES = [
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
-@router.post("/file")
-async def train_file(
-    file: UploadFile = File(...), current_user: User = Depends(get_current_user)
-):
-    if not rate_limiter.check(current_user.id, "train"):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+def _save_upload(file: UploadFile, path: str) -> str:
+    """Copy the upload to disk; returns its sha256."""
+    digest = hashlib.sha256()
+    with open(path, "wb") as buffer:
+        while block := file.file.read(1024 * 1024):
+            digest.update(block)
+            buffer.write(block)
+    return digest.hexdigest()
+
 
+async def enqueue_upload(file: UploadFile, user_id: str) -> dict:
+    """
+    Save an upload and queue its ingestion job. Returns the response body;
+    its "status" is "unchanged" when the file matches what is stored.
+    Raises HTTPException when the upload is refused.
+    """
     if file.content_type not in ALLOWED_TYPES:
         raise HTTPException(status_code=400, detail="Invalid file type")
 
+    if ingest_queue.full():
+        raise HTTPException(
+            status_code=503, detail="Ingestion queue is full, try again later"
+        )
+
     file_id = str(uuid.uuid4())
     file_ext = file.filename.split(".")[-1]
     temp_path = os.path.join(UPLOAD_DIR, file_id + "." + file_ext)
 
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    content_hash = await run_in_threadpool(_save_upload, file, temp_path)
 
     try:
-        text = extract_text_from_file(temp_path, file_ext)
-
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="File is empty")
-
-        # 1. Create Document Record
-        doc_entry = Document(
-            user_id=current_user.id, filename=file.filename, file_type=file_ext
+        job = await run_in_threadpool(
+            create_job,
+            user_id,
+            file.filename,
+            file_ext,
+            temp_path,
+            content_hash,
         )
+    except DocumentUnchanged as e:
+        os.remove(temp_path)
+        return {
+            "message": "Document unchanged",
+            "document_id": e.document_id,
+            "status": "unchanged",
+        }
+    except DocumentBusy:
+        os.remove(temp_path)
+        raise HTTPException(
+            status_code=409,
+            detail="A previous upload of this file is still being processed",
+        )
+    except Exception as e:
+        os.remove(temp_path)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        db = SessionLocal()
-        try:
-            db.add(doc_entry)
-            db.commit()
-            db.refresh(doc_entry)
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=500, detail=str(e))
-        finally:
-            db.close()
-
-        # 2. Process Vectors
-        chunks = split_text(text)
+    try:
+        ingest_queue.submit(job.id)
+    except QueueFullError as e:
+        await fail_job(job.id, str(e))
+        raise HTTPException(
+            status_code=503, detail="Ingestion queue is full, try again later"
+        )
 
-        embeddings = embed_texts(chunks)
+    return {
+        "message": "File accepted for processing",
+        "job_id": job.id,
+        "document_id": job.document_id,
+        "status": job.status,
+        "is_update": job.is_update,
+    }
 
-        ids = [str(uuid.uuid4()) for _ in range(len(chunks))]
 
-        metadatas = [
-            {
-                "source": file.filename,
-                "user_id": current_user.id,
-                "document_id": doc_entry.id,  # Link to SQL Doc
-            }
-            for _ in range(len(chunks))
-        ]
+@router.post("/file", status_code=202)
+async def train_file(
+    file: UploadFile = File(...), current_user: Principal = Depends(get_current_user)
+):
+    """
+    Accept an upload for background ingestion.
+    Poll /api/train_file/jobs/{job_id} for progress.
+
+    Re-uploading a filename updates that document: only changed chunks
+    are embedded, and an identical file returns "unchanged" right away.
+    """
+    if not await rate_limiter.check_async(current_user.id, "train"):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
 
-        add_documents(texts=chunks, embeddings=embeddings, ids=ids, metadatas=metadatas)
+    result = await enqueue_upload(file, current_user.id)
+    if result["status"] == "unchanged":
+        return JSONResponse(status_code=200, content=result)
+    return result
 
-    finally:
-        os.remove(temp_path)
 
-    return {"message": "Text extracted successfully", "characters": len(text)}
+@router.get("/jobs/{job_id}")
+def get_job(
+    job_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Status and progress of an ingestion job.
+    """
+    job = (
+        db.query(IngestJob)
+        .filter(IngestJob.id == job_id, IngestJob.user_id == current_user.id)
+        .first()
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "job_id": job.id,
+        "document_id": job.document_id,
+        "filename": job.filename,
+        "is_update": job.is_update,
+        "status": job.status,
+        "characters": job.characters,
+        "chunks_total": job.chunks_total,
+        "chunks_done": job.chunks_done,
+        "chunks_skipped": job.chunks_skipped,
+        "chunks_reused": job.chunks_reused,
+        "chunks_removed": job.chunks_removed,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
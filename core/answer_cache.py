@@ -0,0 +1,290 @@
+"""
+Semantic cache of /api/ask answers.
+
+A new question reuses a cached answer when its embedding is within
+ANSWER_CACHE_THRESHOLD cosine similarity of a question the same user asked
+before. Entries expire after ANSWER_CACHE_TTL_SECONDS, each user keeps at
+most ANSWER_CACHE_MAX_PER_USER entries, and training or deleting documents
+drops the user's entries.
+
+Entries live in each process, but invalidation must reach all of them:
+every user has a generation counter in a store chosen by
+ANSWER_CACHE_BACKEND ("sqlite", "redis" or "memory", like the rate
+limiter's), which invalidation bumps and lookups compare against.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_PER_USER = int(os.getenv("ANSWER_CACHE_MAX_PER_USER", "256"))
+ANSWER_CACHE_MAX_USERS = int(os.getenv("ANSWER_CACHE_MAX_USERS", "10000"))
+
+ANSWER_CACHE_BACKEND = os.getenv(
+    "ANSWER_CACHE_BACKEND", os.getenv("RATE_LIMIT_BACKEND", "sqlite")
+).lower()
+ANSWER_CACHE_DB_PATH = os.getenv("ANSWER_CACHE_DB_PATH", "./answer_cache.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemoryGenerations:
+    """Per-process only, for tests and single-worker runs."""
+
+    def __init__(self):
+        self._generations = (
+            generations if generations is not None else make_generations()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> int:
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def bump(self, user_id: str):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+
+class SQLiteGenerations:
+    """Shared by processes on one host."""
+
+    def __init__(self, path: str = ANSWER_CACHE_DB_PATH):
+        self._local = threading.local()
+        self.path = path
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS generations "
+            "(user_id TEXT PRIMARY KEY, generation INTEGER NOT NULL) WITHOUT ROWID"
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, user_id: str) -> int:
+        row = (
+            self._db()
+            .execute("SELECT generation FROM generations WHERE user_id = ?", (user_id,))
+            .fetchone()
+        )
+        return row[0] if row else 0
+
+    def bump(self, user_id: str):
+        self._db().execute(
+            """
+            INSERT INTO generations (user_id, generation) VALUES (?, 1)
+            ON CONFLICT (user_id) DO UPDATE SET generation = generation + 1
+            """,
+            (user_id,),
+        )
+
+
+class RedisGenerations:
+    """Shared by every host using the server at REDIS_URL."""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "answergen:"):
+        import redis  # optional dependency, only needed for this backend
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, user_id: str) -> int:
+        return int(self._client.get(self.prefix + user_id) or 0)
+
+    def bump(self, user_id: str):
+        self._client.incr(self.prefix + user_id)
+
+
+def make_generations(name: str = ANSWER_CACHE_BACKEND):
+    if name == "memory":
+        return MemoryGenerations()
+    if name == "sqlite":
+        return SQLiteGenerations()
+    if name == "redis":
+        return RedisGenerations()
+    raise ValueError(f"Unknown ANSWER_CACHE_BACKEND: {name}")
+
+
+class _UserEntries:
+    def __init__(self, generation: int):
+        self.generation = generation  # of the user's knowledge base
+        self.vectors = []  # normalised question embeddings
+        self.entries = []  # {"question", "answer", "sources", "created", "used"}
+        self.matrix = None  # stacked vectors, rebuilt after changes
+
+    def drop(self, positions):
+        for i in sorted(positions, reverse=True):
+            del self.vectors[i]
+            del self.entries[i]
+        self.matrix = None
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS,
+        max_per_user: int = ANSWER_CACHE_MAX_PER_USER,
+        max_users: int = ANSWER_CACHE_MAX_USERS,
+        generations=None,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+
+        self._users: OrderedDict[str, _UserEntries] = OrderedDict()
+        self._generations = (
+            generations if generations is not None else make_generations()
+        )
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, user_id: str) -> int | None:
+        """
+        Token to pass back to store(); invalidation bumps it. None when the
+        store is unreachable, and nothing is cached then.
+        """
+        try:
+            return self._generations.get(user_id)
+        except Exception as e:
+            print(f"Answer cache generation error: {e}")
+            return None
+
+    def lookup(self, user_id: str, embedding) -> dict | None:
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        generation = self.generation(user_id)
+
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None and user.generation != generation:
+                # Invalidated by another process
+                del self._users[user_id]
+                self.invalidations += len(user.entries)
+                user = None
+            if user is None or not user.entries:
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+
+            now = time.time()
+            expired = [
+                i
+                for i, entry in enumerate(user.entries)
+                if now - entry["created"] > self.ttl_seconds
+            ]
+            if expired:
+                user.drop(expired)
+                self.evictions += len(expired)
+                if not user.entries:
+                    self.misses += 1
+                    return None
+
+            if user.matrix is None:
+                user.matrix = np.vstack(user.vectors)
+
+            scores = user.matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = user.entries[best]
+            entry["used"] = now
+            self.hits += 1
+            return {
+                "question": entry["question"],
+                "answer": entry["answer"],
+                "sources": list(entry["sources"]),
+                "similarity": float(scores[best]),
+            }
+
+    def store(
+        self,
+        user_id: str,
+        question: str,
+        embedding,
+        answer: str,
+        sources: list,
+        generation: int,
+    ):
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+
+        # The knowledge base changed while this answer was being built
+        if generation is None or self.generation(user_id) != generation:
+            return
+
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None and user.generation != generation:
+                del self._users[user_id]
+                self.invalidations += len(user.entries)
+                user = None
+            if user is None:
+                user = self._users[user_id] = _UserEntries(generation)
+                while len(self._users) > self.max_users:
+                    _, evicted = self._users.popitem(last=False)
+                    self.evictions += len(evicted.entries)
+            self._users.move_to_end(user_id)
+
+            now = time.time()
+            user.vectors.append(vector)
+            user.entries.append(
+                {
+                    "question": question,
+                    "answer": answer,
+                    "sources": list(sources),
+                    "created": now,
+                    "used": now,
+                }
+            )
+            user.matrix = None
+
+            if len(user.entries) > self.max_per_user:
+                lru = min(
+                    range(len(user.entries)), key=lambda i: user.entries[i]["used"]
+                )
+                user.drop([lru])
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: str):
+        try:
+            self._generations.bump(user_id)
+        except Exception as e:
+            print(f"Answer cache generation error: {e}")
+        with self._lock:
+            user = self._users.pop(user_id, None)
+            if user is not None:
+                self.invalidations += len(user.entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "users": len(self._users),
+            "entries": sum(len(user.entries) for user in self._users.values()),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+answer_cache = AnswerCache()
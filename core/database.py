@@ -1,13 +1,86 @@
-from sqlalchemy import create_engine
+"""
+Database engine and sessions.
+
+DATABASE_URL selects the database (SQLite ./app.db by default). SQLite
+connections run in WAL mode with a busy timeout, so readers never block
+the writer and concurrent writers wait for the lock instead of failing
+with "database is locked". Other databases get a pre-pinged, recycled
+connection pool.
+
+Sessions are sync: routers use get_db, and async handlers run their DB
+work through run_in_threadpool helpers that open SessionLocal. Each query
+is short and sits next to other sync work (chunking, the lexical index),
+and the threadpool keeps it off the event loop without an async driver
+and greenlet, or a second engine and pool to configure.
+"""
+
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = "sqlite:///./app.db"
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+# SQLite only
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "30"))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "65536"))
+
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},  # SQLite only
-)
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints in WAL
+    cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_SECONDS * 1000)}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def _engine_options(url) -> dict:
+    options = {}
+    # In-memory SQLite is a single connection, not a pool
+    if url.database not in (None, "", ":memory:"):
+        options["pool_size"] = DB_POOL_SIZE
+        options["max_overflow"] = DB_MAX_OVERFLOW
+        options["pool_timeout"] = DB_POOL_TIMEOUT_SECONDS
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {
+            "timeout": SQLITE_BUSY_TIMEOUT_SECONDS,
+            "check_same_thread": False,
+        }
+    else:
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = DB_POOL_RECYCLE_SECONDS
+    return options
+
+
+def create_db_engine(url: str = DATABASE_URL):
+    url = make_url(url)
+    engine = create_engine(url, **_engine_options(url))
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas)
+    return engine
+
+
+engine = create_db_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
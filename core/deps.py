@@ -1,21 +1,133 @@
+"""
+Authentication dependency.
+
+Verified tokens are cached for AUTH_CACHE_TTL_SECONDS (never past the
+token's own expiry) as a lightweight Principal, so protected endpoints
+authenticate without touching the database. Updating or deleting a User
+through the ORM drops that user's cached tokens in this process; other
+workers pick the change up when their entries expire.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import event
 
 from core.database import SessionLocal
 from core.jwt import SECRET_KEY, ALGORITHM
 from models.user import User
 
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_TOKENS = int(os.getenv("AUTH_CACHE_MAX_TOKENS", "10000"))
+
 # Use simple bearer instead of OAuth2
 bearer_scheme = HTTPBearer()
 
 
-def get_current_user(
+class Principal(NamedTuple):
+    """The authenticated user, detached from any DB session."""
+
+    id: str
+    name: str
+    email: str
+
+
+class PrincipalCache:
+    def __init__(
+        self,
+        ttl_seconds: int = AUTH_CACHE_TTL_SECONDS,
+        max_tokens: int = AUTH_CACHE_MAX_TOKENS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_tokens = max_tokens
+
+        self._tokens: OrderedDict[str, tuple[Principal, float]] = OrderedDict()
+        self._by_user: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Principal | None:
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            principal, expires = entry
+            if time.time() >= expires:
+                self._drop(token)
+                self.misses += 1
+                return None
+
+            self._tokens.move_to_end(token)
+            self.hits += 1
+            return principal
+
+    def put(self, token: str, principal: Principal, token_expires: float | None):
+        expires = time.time() + self.ttl_seconds
+        if token_expires is not None:
+            expires = min(expires, token_expires)
+
+        with self._lock:
+            self._tokens[token] = (principal, expires)
+            self._tokens.move_to_end(token)
+            self._by_user.setdefault(principal.id, set()).add(token)
+
+            while len(self._tokens) > self.max_tokens:
+                self._drop(next(iter(self._tokens)))
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            for token in self._by_user.pop(user_id, ()):
+                self._tokens.pop(token, None)
+
+    def _drop(self, token: str):
+        principal, _ = self._tokens.pop(token)
+        tokens = self._by_user.get(principal.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[principal.id]
+
+
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    principal_cache.invalidate_user(target.id)
+
+
+def _load_principal(user_id: str) -> Principal | None:
+    db = SessionLocal()
+    try:
+        user = (
+            db.query(User.id, User.name, User.email).filter(User.id == user_id).first()
+        )
+        return Principal(*user) if user else None
+    finally:
+        db.close()
+
+
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-) -> User:
+) -> Principal:
     token = credentials.credentials  # Extract the raw token string
 
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -30,10 +142,9 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    db: Session = SessionLocal()
-    user = db.query(User).filter(User.id == user_id).first()
-
-    if user is None:
+    principal = await run_in_threadpool(_load_principal, user_id)
+    if principal is None:
         raise credentials_exception
 
-    return user
+    principal_cache.put(token, principal, payload.get("exp"))
+    return principal
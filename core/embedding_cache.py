@@ -0,0 +1,198 @@
+"""
+Content-addressed cache for embedding vectors.
+
+Entries are keyed by (model, sha256(text)). Lookups go through an in-memory
+LRU first and then a SQLite file, so identical chunks and repeated questions
+never hit the embeddings API twice, even across restarts.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000"))
+EMBEDDING_CACHE_MAX_BYTES = int(
+    os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))
+)
+
+# Evict down to this fraction of the limit so we don't evict on every insert
+EVICT_TARGET_RATIO = 0.9
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_CHUNK = 500
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+    ):
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, digest)
+            ) WITHOUT ROWID
+            """)
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)"
+        )
+        self._db.commit()
+
+        row = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        )
+        self._disk_bytes = row.fetchone()[0]
+
+    def get_many(self, model: str, texts: list[str]) -> list:
+        """
+        Return a list aligned with texts holding the cached vector or None.
+        """
+        keys = [(model, text_digest(text)) for text in texts]
+        results = [None] * len(texts)
+        missing: dict[tuple, list[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if not missing:
+                return results
+
+            digests = [digest for _, digest in missing]
+            found = {}
+            for start in range(0, len(digests), LOOKUP_CHUNK):
+                chunk = digests[start : start + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT digest, vector FROM embeddings "
+                    f"WHERE model = ? AND digest IN ({placeholders})",
+                    [model, *chunk],
+                )
+                for digest, blob in rows:
+                    found[digest] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND digest = ?",
+                    [(now, model, digest) for digest in found],
+                )
+                self._db.commit()
+
+            for key, positions in missing.items():
+                vector = found.get(key[1])
+                if vector is None:
+                    self.misses += len(positions)
+                    continue
+                self.disk_hits += len(positions)
+                self._remember(key, vector)
+                for i in positions:
+                    results[i] = vector
+
+        return results
+
+    def put_many(self, model: str, texts: list[str], vectors: list[list[float]]):
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = (model, text_digest(text))
+                self._remember(key, vector)
+                rows.append((model, key[1], array("f", vector).tobytes(), now))
+
+            if not rows:
+                return
+
+            # Same model, same dimension: every blob has the same size
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, digest, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+            self._disk_bytes += (self._db.total_changes - before) * len(rows[0][2])
+
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """Drop least recently used rows until under the size target."""
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        while self._disk_bytes > target:
+            rows = self._db.execute(
+                "SELECT model, digest, LENGTH(vector) FROM embeddings "
+                "ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+
+            victims = []
+            for model, digest, size in rows:
+                if self._disk_bytes <= target:
+                    break
+                victims.append((model, digest))
+                self._memory.pop((model, digest), None)
+                self._disk_bytes -= size
+
+            self._db.executemany(
+                "DELETE FROM embeddings WHERE model = ? AND digest = ?", victims
+            )
+            self.evictions += len(victims)
+        self._db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+            "evictions": self.evictions,
+        }
+
+
+embedding_cache = EmbeddingCache()
@@ -1,20 +1,186 @@
 # from sentence_transformers import SentenceTransformer
+import asyncio
 import os
-from openai import OpenAI
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
 
+from core.embedding_cache import embedding_cache
+from core.tokens import count_tokens, truncate_tokens
+
 load_dotenv()
 
 # model = SentenceTransformer("all-MiniLM-L6-v2")
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Retries are handled below, per batch
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# OpenAI embeddings limits: 8191 tokens per input, 2048 inputs and
+# 300k tokens per request. Stay a little under the token cap.
+EMBED_MAX_INPUT_TOKENS = 8191
+EMBED_MAX_BATCH_INPUTS = 2048
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "250000"))
+
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_BACKOFF_BASE = 0.5  # seconds
+EMBED_BACKOFF_MAX = 30.0
+
+# Shared across requests so concurrent uploads can't multiply the fan-out
+_executor = ThreadPoolExecutor(
+    max_workers=EMBED_CONCURRENCY, thread_name_prefix="embed"
+)
+_async_slots = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(
+        error,
+        (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError),
+    ):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _backoff_delay(attempt: int, error: Exception) -> float:
+    """Full-jitter exponential backoff, honouring Retry-After when given."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), EMBED_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(EMBED_BACKOFF_MAX, EMBED_BACKOFF_BASE * 2**attempt))
+
+
+def _make_batches(texts: list[str]) -> list[list[int]]:
+    """Group text positions so each request stays under the input/token caps."""
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (
+            len(current) >= EMBED_MAX_BATCH_INPUTS
+            or current_tokens + tokens > EMBED_MAX_BATCH_TOKENS
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            response = client.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+            # The API tags each vector with its input position
+            data = sorted(response.data, key=lambda d: d.index)
+            return [d.embedding for d in data]
+        except Exception as e:
+            if attempt == EMBED_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _backoff_delay(attempt, e)
+            print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _embed_uncached(texts: list[str]) -> list[list[float]]:
+    texts = [truncate_tokens(text, EMBED_MAX_INPUT_TOKENS) for text in texts]
+    batches = _make_batches(texts)
+
+    if len(batches) == 1:
+        return _embed_batch(texts)
+
+    futures = [
+        _executor.submit(_embed_batch, [texts[i] for i in batch]) for batch in batches
+    ]
+
+    embeddings = [None] * len(texts)
+    for batch, future in zip(batches, futures):
+        for i, vector in zip(batch, future.result()):
+            embeddings[i] = vector
+    return embeddings
 
 
 def embed_texts(texts: list[str]) -> list[list[float]]:
     """
     Convert list of texts into embeddings.
+    Cached vectors are reused; only texts never seen before go to the API.
     """
     # embeddings = model.encode(texts, convert_to_numpy=True)
     # return embeddings.tolist()
 
-    response = client.embeddings.create(input=texts, model="text-embedding-3-small")
-    return [data.embedding for data in response.data]
+    embeddings = embedding_cache.get_many(EMBEDDING_MODEL, texts)
+
+    # Unique misses, so a text repeated in one call is embedded once
+    missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+    if missing:
+        fresh = _embed_uncached(missing)
+        embedding_cache.put_many(EMBEDDING_MODEL, missing, fresh)
+
+        by_text = dict(zip(missing, fresh))
+        embeddings = [
+            e if e is not None else by_text[t] for t, e in zip(texts, embeddings)
+        ]
+
+    return embeddings
+
+
+async def _embed_batch_async(texts: list[str]) -> list[list[float]]:
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            async with _async_slots:
+                response = await async_client.embeddings.create(
+                    input=texts, model=EMBEDDING_MODEL
+                )
+            data = sorted(response.data, key=lambda d: d.index)
+            return [d.embedding for d in data]
+        except Exception as e:
+            if attempt == EMBED_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _backoff_delay(attempt, e)
+            print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def embed_texts_async(texts: list[str]) -> list[list[float]]:
+    """
+    Non-blocking embed_texts for request handlers.
+    Cache I/O runs in a worker thread; API calls share the concurrency cap.
+    """
+    embeddings = await asyncio.to_thread(
+        embedding_cache.get_many, EMBEDDING_MODEL, texts
+    )
+
+    missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+    if missing:
+        truncated = [truncate_tokens(text, EMBED_MAX_INPUT_TOKENS) for text in missing]
+        batches = _make_batches(truncated)
+        results = await asyncio.gather(
+            *(_embed_batch_async([truncated[i] for i in batch]) for batch in batches)
+        )
+
+        fresh = [None] * len(missing)
+        for batch, vectors in zip(batches, results):
+            for i, vector in zip(batch, vectors):
+                fresh[i] = vector
+
+        await asyncio.to_thread(
+            embedding_cache.put_many, EMBEDDING_MODEL, missing, fresh
+        )
+
+        by_text = dict(zip(missing, fresh))
+        embeddings = [
+            e if e is not None else by_text[t] for t, e in zip(texts, embeddings)
+        ]
+
+    return embeddings
@@ -0,0 +1,278 @@
+"""
+Hierarchical Navigable Small World graph for approximate cosine search.
+
+Pure NumPy/Python implementation of Malkov & Yashunin (2016) with the
+neighbour-selection heuristic. Vectors are L2-normalised on insert so the
+similarity is a plain dot product. Deleted labels are tombstoned: they keep
+routing searches through the graph but never show up in results.
+"""
+
+import heapq
+import math
+import os
+import pickle
+import random
+
+import numpy as np
+
+# Graph defaults, overridable per index
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+
+class HNSWIndex:
+    def __init__(
+        self,
+        dim: int,
+        M: int = HNSW_M,
+        ef_construction: int = HNSW_EF_CONSTRUCTION,
+        ef_search: int = HNSW_EF_SEARCH,
+        seed: int = 42,
+    ):
+        self.dim = dim
+        self.M = M
+        self.max_M0 = 2 * M  # layer 0 is denser
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / math.log(max(M, 2))
+        self._rng = random.Random(seed)
+
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.labels: list[str] = []  # node -> label
+        self.nodes: dict[str, int] = {}  # live label -> node
+        self.deleted: set[int] = set()
+        self.graph: list[list[list[int]]] = []  # node -> level -> neighbour nodes
+        self.entry_point = None
+        self.max_level = -1
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def size(self):
+        """Number of nodes in the graph, tombstones included."""
+        return len(self.labels)
+
+    # ---------- insert / delete ----------
+
+    def _grow(self, needed: int):
+        capacity = len(self.vectors)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        grown = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        grown[: self.size] = self.vectors[: self.size]
+        self.vectors = grown
+
+    def add(self, label: str, vector):
+        """Insert one vector. Re-adding a label replaces the old vector."""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+
+        if label in self.nodes:
+            self.mark_deleted(label)
+
+        node = self.size
+        self._grow(node + 1)
+        self.vectors[node] = vector
+        self.labels.append(label)
+        self.nodes[label] = node
+
+        level = int(-math.log(1.0 - self._rng.random()) * self.level_mult)
+        self.graph.append([[] for _ in range(level + 1)])
+
+        if self.entry_point is None:
+            self.entry_point = node
+            self.max_level = level
+            return
+
+        # Greedy descent through the layers above the new node's level
+        entry = self.entry_point
+        for layer in range(self.max_level, level, -1):
+            entry = self._search_layer(vector, [entry], 1, layer)[0][1]
+
+        entries = [entry]
+        for layer in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(
+                vector, entries, self.ef_construction, layer
+            )
+            max_neighbours = self.max_M0 if layer == 0 else self.M
+
+            neighbours = self._select_neighbours(candidates, self.M)
+            self.graph[node][layer] = neighbours
+
+            for neighbour in neighbours:
+                links = self.graph[neighbour][layer]
+                links.append(node)
+                if len(links) > max_neighbours:
+                    self._shrink(neighbour, layer, max_neighbours)
+
+            entries = [n for _, n in candidates]
+
+        if level > self.max_level:
+            self.entry_point = node
+            self.max_level = level
+
+    def mark_deleted(self, label: str) -> bool:
+        node = self.nodes.pop(label, None)
+        if node is None:
+            return False
+        self.deleted.add(node)
+        return True
+
+    # ---------- search ----------
+
+    def search(self, vector, k: int, ef: int = None, allowed=None) -> list:
+        """
+        Return up to k (label, similarity) pairs, best first.
+        allowed, if given, is a predicate on labels used to filter results.
+        """
+        if self.entry_point is None or not self.nodes:
+            return []
+
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+
+        entry = self.entry_point
+        for layer in range(self.max_level, 0, -1):
+            entry = self._search_layer(vector, [entry], 1, layer)[0][1]
+
+        def keep(node):
+            if node in self.deleted:
+                return False
+            return allowed is None or allowed(self.labels[node])
+
+        ef = max(ef or self.ef_search, k)
+        found = self._search_layer(vector, [entry], ef, 0, keep)
+        return [(self.labels[node], sim) for sim, node in found[:k]]
+
+    def _search_layer(self, query, entries, ef, layer, keep=None):
+        """
+        Best-first beam search on one layer. Every node steers the traversal,
+        but only nodes passing keep() enter the result set.
+        Returns (similarity, node) pairs sorted best first.
+        """
+        visited = set(entries)
+        sims = self.vectors[entries] @ query
+
+        candidates = []  # max-heap on similarity (negated)
+        results = []  # min-heap on similarity, capped at ef
+        for node, sim in zip(entries, sims.tolist()):
+            heapq.heappush(candidates, (-sim, node))
+            if keep is None or keep(node):
+                heapq.heappush(results, (sim, node))
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if len(results) >= ef and -neg_sim < results[0][0]:
+                break
+
+            links = self.graph[node]
+            if layer >= len(links):
+                continue
+            fresh = [n for n in links[layer] if n not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+
+            for n, sim in zip(fresh, (self.vectors[fresh] @ query).tolist()):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, n))
+                    if keep is None or keep(n):
+                        heapq.heappush(results, (sim, n))
+                        if len(results) > ef:
+                            heapq.heappop(results)
+
+        return sorted(results, reverse=True)
+
+    def _select_neighbours(self, candidates, m: int) -> list[int]:
+        """
+        Heuristic selection: keep a candidate only if it is closer to the
+        base node than to every neighbour already kept. Spreads links across
+        clusters instead of spending them all on one.
+        """
+        if len(candidates) <= m:
+            return [node for _, node in candidates]
+
+        nodes = [node for _, node in candidates]
+        # One matmul for all candidate pairs instead of one per candidate
+        pairwise = self.vectors[nodes] @ self.vectors[nodes].T
+
+        sims = [sim for sim, _ in candidates]
+        closest = np.full(len(nodes), -np.inf, dtype=np.float32)
+
+        selected = []  # positions into nodes
+        for i, sim in enumerate(sims):
+            # closest[i]: similarity of candidate i to its nearest kept node
+            if closest[i] > sim:
+                continue
+            selected.append(i)
+            if len(selected) >= m:
+                break
+            np.maximum(closest, pairwise[i], out=closest)
+
+        # Top up with the nearest leftovers so sparse regions stay connected
+        if len(selected) < m:
+            chosen = set(selected)
+            for i in range(len(nodes)):
+                if len(selected) >= m:
+                    break
+                if i not in chosen:
+                    selected.append(i)
+        return [nodes[i] for i in selected]
+
+    def _shrink(self, node: int, layer: int, max_neighbours: int):
+        links = self.graph[node][layer]
+        sims = (self.vectors[links] @ self.vectors[node]).tolist()
+        ranked = sorted(zip(sims, links), reverse=True)
+        self.graph[node][layer] = self._select_neighbours(ranked, max_neighbours)
+
+    # ---------- persistence ----------
+
+    def save(self, path: str):
+        state = {
+            "dim": self.dim,
+            "M": self.M,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "labels": self.labels,
+            "deleted": self.deleted,
+            "graph": self.graph,
+            "entry_point": self.entry_point,
+            "max_level": self.max_level,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            np.save(f, self.vectors[: self.size])
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "HNSWIndex":
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+            vectors = np.load(f)
+
+        index = cls(
+            state["dim"],
+            M=state["M"],
+            ef_construction=state["ef_construction"],
+            ef_search=state["ef_search"],
+        )
+        index.vectors = vectors
+        index.labels = state["labels"]
+        index.deleted = state["deleted"]
+        index.graph = state["graph"]
+        index.entry_point = state["entry_point"]
+        index.max_level = state["max_level"]
+        index.nodes = {
+            label: node
+            for node, label in enumerate(index.labels)
+            if node not in index.deleted
+        }
+        return index
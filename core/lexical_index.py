@@ -0,0 +1,204 @@
+"""
+BM25 keyword index of stored chunks, kept next to the vector store.
+
+Vector search is weak on exact identifiers, codes and names; SQLite FTS5
+handles those well. Every chunk written through core.vectorstore is also
+written here, and deletes are mirrored, so the two stay in step. Queries
+are scoped to one user and return matches in the same shape as
+query_documents.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./lexical_index.db")
+
+# Longest keyword query sent to FTS5
+MAX_QUERY_TERMS = 32
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_CHUNK = 500
+
+_TERM = re.compile(r"\w+")
+
+
+def _match_query(user_id: str, text: str) -> str | None:
+    terms = list(dict.fromkeys(term.lower() for term in _TERM.findall(text)))
+    terms = [term for term in terms if len(term) > 1 or term.isdigit()]
+    if not terms:
+        return None
+    keywords = " OR ".join(f'"{term}"' for term in terms[:MAX_QUERY_TERMS])
+    return f'user_id : "{user_id}" AND text : ({keywords})'
+
+
+class LexicalIndex:
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                text,
+                user_id,
+                metadata UNINDEXED,
+                tokenize = 'unicode61'
+            )
+            """)
+        # FTS5 can only look rows up by rowid; map vector ids onto them
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_rows (
+                vector_id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL,
+                user_id TEXT NOT NULL,
+                document_id TEXT
+            )
+            """)
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS ix_chunk_rows_document "
+            "ON chunk_rows (user_id, document_id)"
+        )
+        self._db.commit()
+
+    def add(self, ids: list[str], texts: list[str], metadatas: list[dict]):
+        with self._lock:
+            self._delete_rows(self._rows_for_ids(ids))
+            for vector_id, text, metadata in zip(ids, texts, metadatas):
+                user_id = metadata.get("user_id")
+                if not user_id:
+                    continue
+                cursor = self._db.execute(
+                    "INSERT INTO chunks (text, user_id, metadata) VALUES (?, ?, ?)",
+                    (text, user_id, json.dumps(metadata)),
+                )
+                self._db.execute(
+                    "INSERT INTO chunk_rows (vector_id, row, user_id, document_id) "
+                    "VALUES (?, ?, ?, ?)",
+                    (vector_id, cursor.lastrowid, user_id, metadata.get("document_id")),
+                )
+            self._db.commit()
+
+    def delete(self, ids: list[str] | None = None, filter: dict | None = None):
+        """
+        Mirror of VectorBackend.delete. Filters may only use user_id and
+        document_id equality, which is all the app deletes by.
+        """
+        with self._lock:
+            if ids is not None:
+                rows = self._rows_for_ids(ids)
+            else:
+                rows = self._rows_for_filter(filter or {})
+            self._delete_rows(rows)
+            self._db.commit()
+
+    def update_metadata(self, updates: dict[str, dict]):
+        """Mirror of VectorBackend.update_metadata; the text is not reindexed."""
+        with self._lock:
+            for vector_id, fields in updates.items():
+                found = self._db.execute(
+                    "SELECT c.rowid, c.metadata FROM chunk_rows r "
+                    "JOIN chunks c ON c.rowid = r.row WHERE r.vector_id = ?",
+                    (vector_id,),
+                ).fetchone()
+                if found is None:
+                    continue
+                row, metadata = found
+                metadata = {**json.loads(metadata), **fields}
+                self._db.execute(
+                    "UPDATE chunks SET metadata = ? WHERE rowid = ?",
+                    (json.dumps(metadata), row),
+                )
+            self._db.commit()
+
+    def texts(self, ids: list[str]) -> dict[str, str]:
+        """Stored chunk text by vector id, for the ids that are indexed."""
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), LOOKUP_CHUNK):
+                batch = ids[i : i + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(batch))
+                found.update(
+                    self._db.execute(
+                        "SELECT r.vector_id, c.text FROM chunk_rows r "
+                        "JOIN chunks c ON c.rowid = r.row "
+                        f"WHERE r.vector_id IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                )
+        return found
+
+    def clear(self):
+        """Drop every indexed chunk, e.g. when the vector store is reset."""
+        with self._lock:
+            self._db.execute("DELETE FROM chunks")
+            self._db.execute("DELETE FROM chunk_rows")
+            self._db.commit()
+
+    def _rows_for_ids(self, ids: list[str]) -> list[int]:
+        rows = []
+        for i in range(0, len(ids), LOOKUP_CHUNK):
+            batch = ids[i : i + LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(
+                row
+                for (row,) in self._db.execute(
+                    f"SELECT row FROM chunk_rows WHERE vector_id IN ({placeholders})",
+                    batch,
+                )
+            )
+        return rows
+
+    def _rows_for_filter(self, filter: dict) -> list[int]:
+        unsupported = set(filter) - {"user_id", "document_id"}
+        if unsupported or "user_id" not in filter:
+            raise ValueError(f"Unsupported lexical index filter: {filter}")
+
+        sql = "SELECT row FROM chunk_rows WHERE user_id = ?"
+        params = [filter["user_id"]]
+        if "document_id" in filter:
+            sql += " AND document_id = ?"
+            params.append(filter["document_id"])
+        return [row for (row,) in self._db.execute(sql, params)]
+
+    def _delete_rows(self, rows: list[int]):
+        for i in range(0, len(rows), LOOKUP_CHUNK):
+            batch = rows[i : i + LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(batch))
+            self._db.execute(
+                f"DELETE FROM chunks WHERE rowid IN ({placeholders})", batch
+            )
+            self._db.execute(
+                f"DELETE FROM chunk_rows WHERE row IN ({placeholders})", batch
+            )
+
+    def search(self, user_id: str, query: str, top_k: int) -> dict:
+        """BM25 matches for the query's keywords, best first."""
+        match = _match_query(user_id, query)
+        if match is None:
+            return {"matches": []}
+
+        with self._lock:
+            rows = self._db.execute(
+                """
+                SELECT chunk_rows.vector_id, bm25(chunks, 1.0, 0.0), chunks.metadata
+                FROM chunks JOIN chunk_rows ON chunk_rows.row = chunks.rowid
+                WHERE chunks MATCH ?
+                ORDER BY bm25(chunks, 1.0, 0.0)
+                LIMIT ?
+                """,
+                (match, top_k),
+            ).fetchall()
+
+        # bm25() is lower-is-better; flip it so scores read like similarities
+        return {
+            "matches": [
+                {"id": vector_id, "score": -rank, "metadata": json.loads(metadata)}
+                for vector_id, rank, metadata in rows
+            ]
+        }
+
+
+lexical_index = LexicalIndex()
@@ -1,9 +1,10 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 SYSTEM_PROMPT = """
 You are a helpful assistant.
@@ -12,9 +13,11 @@ If the answer is not present in the context, say:
 "I don't know based on the provided information."
 """
 
+TITLE_PROMPT = "You are a helpful assistant. Generate a short, concise title (max 5 words) for the user's question. Do not include quotes."
 
-def generate_answer(context: str, question: str) -> str:
-    response = client.chat.completions.create(
+
+def _answer_request(context: str, question: str) -> dict:
+    return dict(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
@@ -30,23 +33,54 @@ def generate_answer(context: str, question: str) -> str:
         max_tokens=50,
     )
 
-    return response.choices[0].message.content.strip()
-
 
-def generate_title(question: str) -> str:
-    """
-    Generates a short 3-5 word title for a conversation based on the first question.
-    """
-    response = client.chat.completions.create(
+def _title_request(question: str) -> dict:
+    return dict(
         model="gpt-4o-mini",
         messages=[
-            {
-                "role": "system",
-                "content": "You are a helpful assistant. Generate a short, concise title (max 5 words) for the user's question. Do not include quotes.",
-            },
+            {"role": "system", "content": TITLE_PROMPT},
             {"role": "user", "content": question},
         ],
         temperature=0.5,
         max_tokens=10,
     )
+
+
+def generate_answer(context: str, question: str) -> str:
+    response = client.chat.completions.create(**_answer_request(context, question))
+    return response.choices[0].message.content.strip()
+
+
+def generate_title(question: str) -> str:
+    """
+    Generates a short 3-5 word title for a conversation based on the first question.
+    """
+    response = client.chat.completions.create(**_title_request(question))
+    return response.choices[0].message.content.strip()
+
+
+async def generate_answer_async(context: str, question: str) -> str:
+    response = await async_client.chat.completions.create(
+        **_answer_request(context, question)
+    )
     return response.choices[0].message.content.strip()
+
+
+async def generate_title_async(question: str) -> str:
+    response = await async_client.chat.completions.create(**_title_request(question))
+    return response.choices[0].message.content.strip()
+
+
+async def stream_answer(context: str, question: str):
+    """
+    Same prompt as generate_answer, yielding text deltas as they arrive.
+    """
+    stream = await async_client.chat.completions.create(
+        **_answer_request(context, question), stream=True
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
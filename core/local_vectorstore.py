@@ -0,0 +1,633 @@
+"""
+In-process vector store backed by memory-mapped NumPy segment files.
+
+Vectors are partitioned per tenant (the ``user_id`` metadata field), and each
+tenant lives in its own directory under ``VECTOR_DATA_DIR``:
+
+    <tenant>/manifest.json   segment names, tombstoned rows, dimension
+    <tenant>/seg-<n>.npy     float32 matrix of L2-normalised embeddings
+    <tenant>/seg-<n>.json    ids and metadata for the rows of that matrix
+    <tenant>/hnsw.idx        HNSW graph, only for tenants past HNSW_MIN_VECTORS
+
+Segments are immutable once written. Deletes only tombstone rows, and a
+background thread merges the live rows into a single segment once enough
+segments or dead rows pile up.
+
+Small tenants are searched exactly. Once a tenant grows past
+HNSW_MIN_VECTORS the maintenance thread builds an HNSW graph and keeps
+feeding it new segments; rows it has not indexed yet are still searched
+exactly, so writes never wait on graph inserts.
+"""
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from core.hnsw import HNSWIndex
+
+VECTOR_DATA_DIR = os.getenv("VECTOR_DATA_DIR", "./vector_data")
+
+SHARED_TENANT = "_shared"
+
+# Compaction triggers
+COMPACT_MAX_SEGMENTS = 8
+COMPACT_DEAD_RATIO = 0.2
+
+# Tenants at least this large get an approximate (HNSW) index
+HNSW_MIN_VECTORS = int(os.getenv("HNSW_MIN_VECTORS", "20000"))
+# Graph inserts per lock hold (a few ms), so searches interleave with indexing
+HNSW_INDEX_BATCH = 16
+# Tombstoned graph nodes tolerated beyond the live ones before a rebuild
+HNSW_REBUILD_SLACK = 256
+
+
+def _write_json(path: str, data) -> None:
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _tenant_key(user_id) -> str:
+    if not user_id:
+        return SHARED_TENANT
+    # Tenant keys become directory names
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(user_id))
+
+
+def _filter_value(condition):
+    """Return the single value an equality condition pins, or None."""
+    if isinstance(condition, dict):
+        return condition.get("$eq")
+    return condition
+
+
+def _metadata_matches(meta: dict, where: dict) -> bool:
+    """Scalar counterpart of Segment.match for a single row."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_metadata_matches(meta, sub) for sub in condition):
+                return False
+            continue
+
+        value = meta.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        for op, expected in condition.items():
+            if op == "$eq" and value != expected:
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and value not in expected:
+                return False
+            if op == "$nin" and value in expected:
+                return False
+            if op not in ("$eq", "$ne", "$in", "$nin"):
+                raise ValueError(f"Unsupported filter operator: {op}")
+    return True
+
+
+class Segment:
+    def __init__(self, name: str, vectors: np.ndarray, ids: list, metadatas: list):
+        self.name = name
+        self.vectors = vectors
+        self.ids = ids
+        self.metadatas = metadatas
+        self.alive = np.ones(len(ids), dtype=bool)
+        # True once every row has been added to the tenant's HNSW graph
+        self.indexed = False
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, key: str) -> np.ndarray:
+        """Metadata field as an object array, built once per segment."""
+        col = self._columns.get(key)
+        if col is None:
+            col = np.empty(len(self.ids), dtype=object)
+            col[:] = [meta.get(key) for meta in self.metadatas]
+            self._columns[key] = col
+        return col
+
+    def match(self, where: dict) -> np.ndarray:
+        """
+        Evaluate a Pinecone-style metadata filter against every row.
+        Supports plain equality, $eq, $ne, $in, $nin and $and.
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for sub in condition:
+                    mask &= self.match(sub)
+                continue
+
+            col = self.column(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+
+            for op, value in condition.items():
+                if op == "$eq":
+                    mask &= col == value
+                elif op == "$ne":
+                    mask &= col != value
+                elif op == "$in":
+                    mask &= np.isin(col, list(value))
+                elif op == "$nin":
+                    mask &= ~np.isin(col, list(value))
+                else:
+                    raise ValueError(f"Unsupported filter operator: {op}")
+        return mask
+
+
+class Tenant:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.segments: list[Segment] = []
+        self.locations: dict[str, tuple[Segment, int]] = {}
+        self.dim = None
+
+        self.hnsw = None
+        self.hnsw_building = None
+        self.hnsw_lock = threading.Lock()
+        self.hnsw_dirty = False
+        self.scheduled = False
+
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # ---------- persistence ----------
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    @property
+    def hnsw_path(self):
+        return os.path.join(self.path, "hnsw.idx")
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        self.dim = manifest.get("dim")
+
+        for entry in manifest.get("segments", []):
+            segment = self._open_segment(entry["name"])
+            segment.alive[entry.get("dead", [])] = False
+            self._attach(segment)
+
+        # Segments left behind by an interrupted compaction
+        known = {entry["name"] for entry in manifest.get("segments", [])}
+        for filename in os.listdir(self.path):
+            stem, ext = os.path.splitext(filename)
+            if filename.startswith("seg-") and ext in (".npy", ".json"):
+                if stem not in known:
+                    self._remove_file(os.path.join(self.path, filename))
+
+        if os.path.exists(self.hnsw_path):
+            try:
+                self.hnsw = HNSWIndex.load(self.hnsw_path)
+            except Exception as e:
+                print(f"Discarding unreadable HNSW index in {self.path}: {e}")
+                self.hnsw = None
+            else:
+                self._reconcile_hnsw()
+
+    def _reconcile_hnsw(self):
+        """
+        The graph is saved lazily, so it can lag behind the manifest.
+        Tombstone labels that are gone and mark fully covered segments.
+        """
+        for label in list(self.hnsw.nodes):
+            if label not in self.locations:
+                self.hnsw.mark_deleted(label)
+
+        for seg in self.segments:
+            seg.indexed = all(
+                self.hnsw.nodes.get(seg.ids[row]) is not None
+                for row in np.flatnonzero(seg.alive)
+            )
+
+    def _save_manifest(self):
+        _write_json(
+            self.manifest_path,
+            {
+                "dim": self.dim,
+                "segments": [
+                    {
+                        "name": seg.name,
+                        "dead": np.flatnonzero(~seg.alive).tolist(),
+                    }
+                    for seg in self.segments
+                ],
+            },
+        )
+
+    def _open_segment(self, name: str) -> Segment:
+        vectors = np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+        with open(os.path.join(self.path, name + ".json"), "r", encoding="utf-8") as f:
+            rows = json.load(f)
+
+        return Segment(name, vectors, rows["ids"], rows["metadatas"])
+
+    def _write_segment(
+        self, vectors: np.ndarray, ids: list, metadatas: list
+    ) -> Segment:
+        name = f"seg-{uuid.uuid4().hex[:12]}"
+        base = os.path.join(self.path, name)
+
+        # Write under temporary names so a crash never leaves a half segment
+        np.save(base + ".tmp.npy", np.ascontiguousarray(vectors, dtype=np.float32))
+        os.replace(base + ".tmp.npy", base + ".npy")
+        _write_json(base + ".json", {"ids": ids, "metadatas": metadatas})
+
+        return self._open_segment(name)
+
+    def _attach(self, segment: Segment):
+        self.segments.append(segment)
+        for row, vector_id in enumerate(segment.ids):
+            if segment.alive[row]:
+                self.locations[vector_id] = (segment, row)
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            # Still memory-mapped somewhere (Windows); cleaned up on next load
+            pass
+
+    # ---------- mutations ----------
+
+    def upsert(self, ids: list, vectors: np.ndarray, metadatas: list):
+        with self.lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dim}"
+                )
+
+            # Re-upserting an id replaces the old row
+            self._tombstone(ids)
+
+            segment = self._write_segment(_normalize(vectors), ids, metadatas)
+            self._attach(segment)
+            self._save_manifest()
+
+    def delete(self, ids=None, where=None) -> int:
+        with self.lock:
+            if where is not None:
+                ids = []
+                for seg in self.segments:
+                    mask = seg.alive & seg.match(where)
+                    ids.extend(seg.ids[row] for row in np.flatnonzero(mask))
+
+            removed = self._tombstone(ids or [])
+            if removed:
+                self._save_manifest()
+            return removed
+
+    def update_metadata(self, updates: dict[str, dict]):
+        """Rewrite rows with merged metadata; their vectors are copied as is."""
+        with self.lock:
+            ids, vectors, metadatas = [], [], []
+            for vector_id, fields in updates.items():
+                location = self.locations.get(vector_id)
+                if location is None:
+                    continue
+                segment, row = location
+                ids.append(vector_id)
+                vectors.append(segment.vectors[row])
+                metadatas.append({**segment.metadatas[row], **fields})
+            if ids:
+                self.upsert(ids, np.asarray(vectors, dtype=np.float32), metadatas)
+
+    def _tombstone(self, ids) -> int:
+        removed = 0
+        for vector_id in ids:
+            location = self.locations.pop(vector_id, None)
+            if location is None:
+                continue
+            segment, row = location
+            segment.alive[row] = False
+            removed += 1
+
+        graphs = [g for g in (self.hnsw, self.hnsw_building) if g is not None]
+        if removed and graphs:
+            with self.hnsw_lock:
+                for graph in graphs:
+                    for vector_id in ids:
+                        self.hnsw_dirty |= graph.mark_deleted(vector_id)
+        return removed
+
+    # ---------- search ----------
+
+    def search(self, query: np.ndarray, top_k: int, where=None, include_values=False):
+        with self.lock:
+            segments = list(self.segments)
+            hnsw = self.hnsw
+
+        candidates = []  # (score, segment, row)
+        if hnsw is not None:
+            candidates.extend(self._search_hnsw(hnsw, query, top_k, where))
+            segments = [seg for seg in segments if not seg.indexed]
+
+        for seg in segments:
+            mask = seg.alive.copy()
+            if where:
+                mask &= seg.match(where)
+
+            live = int(mask.sum())
+            if live == 0:
+                continue
+
+            scores = np.asarray(seg.vectors @ query)
+            scores = np.where(mask, scores, -np.inf)
+
+            k = min(top_k, live)
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates.extend((float(scores[row]), seg, int(row)) for row in top)
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+
+        matches = []
+        seen = set()
+        for score, seg, row in candidates:
+            if len(matches) >= top_k:
+                break
+            # A row can be both in the graph and in a not-yet-indexed segment
+            if seg.ids[row] in seen:
+                continue
+            seen.add(seg.ids[row])
+
+            match = {
+                "id": seg.ids[row],
+                "score": score,
+                "metadata": seg.metadatas[row],
+            }
+            if include_values:
+                match["values"] = seg.vectors[row].tolist()
+            matches.append(match)
+        return matches
+
+    def _search_hnsw(self, hnsw: HNSWIndex, query, top_k: int, where=None):
+        def allowed(label):
+            location = self.locations.get(label)
+            if location is None:
+                return False
+            seg, row = location
+            return not where or _metadata_matches(seg.metadatas[row], where)
+
+        with self.hnsw_lock:
+            hits = hnsw.search(query, top_k, allowed=allowed)
+
+        candidates = []
+        for label, score in hits:
+            location = self.locations.get(label)
+            if location is not None:
+                seg, row = location
+                candidates.append((score, seg, row))
+        return candidates
+
+    # ---------- background maintenance ----------
+
+    def needs_indexing(self) -> bool:
+        if self.hnsw is None:
+            return len(self.locations) >= HNSW_MIN_VECTORS
+        # Rebuild once tombstones outnumber live nodes
+        if self.hnsw.size > 2 * len(self.hnsw) + HNSW_REBUILD_SLACK:
+            return True
+        return any(not seg.indexed for seg in self.segments)
+
+    def needs_maintenance(self) -> bool:
+        return self.needs_compaction() or self.needs_indexing()
+
+    def maintain(self):
+        if self.needs_indexing():
+            self.build_index()
+        if self.needs_compaction():
+            self.compact()
+        if self.hnsw_dirty:
+            with self.hnsw_lock:
+                self.hnsw.save(self.hnsw_path)
+                self.hnsw_dirty = False
+
+    def build_index(self):
+        """Feed every unindexed segment into the HNSW graph."""
+        with self.lock:
+            hnsw = self.hnsw
+            if hnsw is None or hnsw.size > 2 * len(hnsw) + HNSW_REBUILD_SLACK:
+                # New graph; the old one keeps serving until the swap
+                hnsw = HNSWIndex(self.dim)
+                self.hnsw_building = hnsw
+                pending = list(self.segments)
+            else:
+                pending = [seg for seg in self.segments if not seg.indexed]
+
+        # Deletes tombstone the graph too, and an insert re-checks alive
+        # under hnsw_lock, so rows deleted mid-build never stay live
+        fresh = hnsw is not self.hnsw
+        for seg in pending:
+            rows = np.flatnonzero(seg.alive).tolist()
+            for start in range(0, len(rows), HNSW_INDEX_BATCH):
+                with self.hnsw_lock:
+                    for row in rows[start : start + HNSW_INDEX_BATCH]:
+                        vector_id = seg.ids[row]
+                        if not seg.alive[row] or vector_id in hnsw.nodes:
+                            continue
+                        hnsw.add(vector_id, seg.vectors[row])
+                # Let a waiting search take the lock before the next batch
+                time.sleep(0)
+
+        with self.lock:
+            if fresh:
+                self.hnsw = hnsw
+                self.hnsw_building = None
+                self._reconcile_hnsw()
+            else:
+                for seg in pending:
+                    seg.indexed = True
+            self.hnsw_dirty = True
+
+    # ---------- compaction ----------
+
+    def needs_compaction(self) -> bool:
+        total = sum(len(seg) for seg in self.segments)
+        if total == 0:
+            return False
+        dead = total - len(self.locations)
+        return (
+            len(self.segments) > COMPACT_MAX_SEGMENTS
+            or dead / total > COMPACT_DEAD_RATIO
+        )
+
+    def compact(self):
+        with self.lock:
+            if not self.needs_compaction():
+                return
+            old_segments = list(self.segments)
+            snapshots = [seg.alive.copy() for seg in old_segments]
+
+        # Heavy copy runs without the lock so queries and upserts continue
+        ids, metadatas, blocks = [], [], []
+        for seg, alive in zip(old_segments, snapshots):
+            rows = np.flatnonzero(alive)
+            if len(rows) == 0:
+                continue
+            blocks.append(np.asarray(seg.vectors[rows]))
+            ids.extend(seg.ids[row] for row in rows)
+            metadatas.extend(seg.metadatas[row] for row in rows)
+
+        with self.lock:
+            merged = None
+            if ids:
+                # Vectors are already normalised
+                merged = self._write_segment(np.concatenate(blocks), ids, metadatas)
+                merged.indexed = all(seg.indexed for seg in old_segments)
+
+                # Rows deleted while we were copying stay deleted
+                position = 0
+                for seg, alive in zip(old_segments, snapshots):
+                    for row in np.flatnonzero(alive):
+                        if not seg.alive[row]:
+                            merged.alive[position] = False
+                        position += 1
+
+            added_since = [seg for seg in self.segments if seg not in old_segments]
+            self.segments = []
+            self.locations = {}
+            if merged is not None:
+                self._attach(merged)
+            for seg in added_since:
+                self._attach(seg)
+            self._save_manifest()
+
+        for seg in old_segments:
+            for ext in (".npy", ".json"):
+                self._remove_file(os.path.join(self.path, seg.name + ext))
+
+
+class LocalVectorStore:
+    def __init__(self, root: str = VECTOR_DATA_DIR):
+        self.root = root
+        self._tenants: dict[str, Tenant] = {}
+        self._lock = threading.Lock()
+        self._maintenance_queue = queue.Queue()
+
+        os.makedirs(root, exist_ok=True)
+        threading.Thread(
+            target=self._maintenance_worker, name="vector-maintenance", daemon=True
+        ).start()
+
+    def _tenant(self, key: str) -> Tenant:
+        with self._lock:
+            tenant = self._tenants.get(key)
+            if tenant is None:
+                tenant = Tenant(os.path.join(self.root, key))
+                self._tenants[key] = tenant
+                # Pick up indexing or compaction left over from the last run
+                self._schedule_maintenance(tenant)
+            return tenant
+
+    def _route(self, where) -> tuple[list[Tenant], dict]:
+        """
+        Pick the tenants a filter can touch. The user_id condition is implied
+        by the partition, so it is dropped from the filter we hand back.
+        """
+        where = dict(where or {})
+        user_id = _filter_value(where.get("user_id"))
+        if user_id:
+            where.pop("user_id")
+            key = _tenant_key(user_id)
+            if not os.path.isdir(os.path.join(self.root, key)):
+                return [], where
+            return [self._tenant(key)], where
+
+        # No tenant in the filter: fan out over everything on disk
+        tenants = [
+            self._tenant(key)
+            for key in sorted(os.listdir(self.root))
+            if os.path.isdir(os.path.join(self.root, key))
+        ]
+        return tenants, where
+
+    def _schedule_maintenance(self, tenant: Tenant):
+        with tenant.lock:
+            if tenant.scheduled or not tenant.needs_maintenance():
+                return
+            tenant.scheduled = True
+        self._maintenance_queue.put(tenant)
+
+    def _maintenance_worker(self):
+        while True:
+            tenant = self._maintenance_queue.get()
+            with tenant.lock:
+                tenant.scheduled = False
+            try:
+                tenant.maintain()
+            except Exception as e:
+                print(f"Error maintaining vectors in {tenant.path}: {e}")
+
+    def upsert(self, vectors: list[dict]):
+        groups: dict[str, list[dict]] = {}
+        for vector in vectors:
+            key = _tenant_key(vector["metadata"].get("user_id"))
+            groups.setdefault(key, []).append(vector)
+
+        for key, group in groups.items():
+            tenant = self._tenant(key)
+            tenant.upsert(
+                ids=[v["id"] for v in group],
+                vectors=np.asarray([v["values"] for v in group], dtype=np.float32),
+                metadatas=[v["metadata"] for v in group],
+            )
+            self._schedule_maintenance(tenant)
+
+    def query(self, vector, top_k: int, filter=None, include_values=False) -> dict:
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+
+        tenants, where = self._route(filter)
+
+        matches = []
+        for tenant in tenants:
+            matches.extend(tenant.search(query, top_k, where, include_values))
+
+        matches.sort(key=lambda m: m["score"], reverse=True)
+        return {"matches": matches[:top_k]}
+
+    def delete(self, ids=None, filter=None):
+        if ids is None and not filter:
+            raise ValueError("Refusing to delete without ids or a filter")
+
+        tenants, where = self._route(filter)
+        for tenant in tenants:
+            if ids is not None:
+                tenant.delete(ids=ids)
+            else:
+                tenant.delete(where=where)
+            self._schedule_maintenance(tenant)
+
+    def update_metadata(self, updates: dict[str, dict], filter=None):
+        tenants, _ = self._route(filter)
+        for tenant in tenants:
+            tenant.update_metadata(updates)
+            self._schedule_maintenance(tenant)
@@ -0,0 +1,60 @@
+"""
+Minimal schema upgrades for existing databases.
+
+create_all only creates missing tables, so columns added to a model later
+are added here with ALTER TABLE. Only nullable columns or columns with a
+server default can be added this way. Indexes added to a model later are
+created the same way, and fill_nulls backfills a column that became
+required.
+"""
+
+from sqlalchemy import inspect, text, update
+from sqlalchemy.schema import CreateColumn
+
+
+def add_missing_columns(engine, metadata):
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    print(
+                        f"Cannot add NOT NULL column {table.name}.{column.name} "
+                        "without a server default; migrate it by hand"
+                    )
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                print(f"Added column {table.name}.{column.name}")
+
+
+def add_missing_indexes(engine, metadata):
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+
+    for table in metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            index.create(bind=engine)
+            print(f"Added index {index.name}")
+
+
+def fill_nulls(engine, column, value):
+    """Set column to value (a literal or another column) where it is NULL."""
+    with engine.begin() as conn:
+        result = conn.execute(
+            update(column.table).where(column.is_(None)).values({column: value})
+        )
+        if result.rowcount:
+            print(f"Filled {result.rowcount} NULL {column.table.name}.{column.name}")
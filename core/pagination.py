@@ -0,0 +1,73 @@
+"""
+Keyset (cursor) pagination.
+
+A page is read with WHERE (sort_key, id) < (last sort_key, last id) over
+an index on (..., sort_key, id), so every page costs the same however deep
+it is. Cursors are opaque to clients: url-safe base64 of the last row's
+sort key and id, datetimes in ISO format.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import String, tuple_, type_coerce
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_value, row_id: str) -> str:
+    fields = [sort_value, row_id]
+    if isinstance(sort_value, datetime):
+        fields = [sort_value.isoformat(), row_id, "datetime"]
+    raw = json.dumps(fields, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id, *kind = json.loads(base64.urlsafe_b64decode(padded))
+        if kind == ["datetime"]:
+            sort_value = datetime.fromisoformat(sort_value)
+        elif kind:
+            raise ValueError(kind)
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+    return sort_value, row_id
+
+
+def keyset_page(
+    query, sort_key, id_column, cursor: str | None, limit: int, descending=True
+):
+    """
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    `query` selects plain columns; each row gains a `sort_key` field.
+    """
+    key = sort_key
+    if query.session.get_bind().dialect.name == "sqlite":
+        # Compare and hand out the value as stored: SQLite keeps timestamps
+        # as text, and a re-rendered datetime would not compare equal to it
+        key = type_coerce(sort_key, String)
+
+    if cursor:
+        position = tuple_(key, id_column)
+        after = tuple_(*decode_cursor(cursor))
+        query = query.filter(position < after if descending else position > after)
+
+    if descending:
+        query = query.order_by(key.desc(), id_column.desc())
+    else:
+        query = query.order_by(key.asc(), id_column.asc())
+
+    rows = query.add_columns(key.label("sort_key")).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].sort_key, rows[-1].id)
@@ -1,5 +1,24 @@
+"""
+Per-user rate limiting with GCRA (generic cell rate algorithm).
+
+Each key stores a single "theoretical arrival time" (TAT), so a check is
+O(1) in time and memory whatever the limit. An action allowed `limit`
+times per WINDOW_SECONDS gets one emission interval of window / limit per
+request and may burst up to `limit` requests when idle.
+
+State lives in a backend chosen by RATE_LIMIT_BACKEND:
+- "sqlite" (default): a SQLite file shared by every worker on the host
+- "redis": any Redis-compatible server at REDIS_URL, for multiple hosts
+- "memory": per-process only, for tests and single-worker runs
+Keys whose TAT is in the past carry no state and are evicted.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
 import time
-from collections import defaultdict
+from collections import OrderedDict
 
 # requests per window
 RATE_LIMITS = {
@@ -9,26 +28,149 @@ RATE_LIMITS = {
 
 WINDOW_SECONDS = 60  # per minute
 
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite").lower()
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "./rate_limits.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Idle keys are swept every this many checks (SQLite backend)
+SWEEP_EVERY = 1000
+
+
+class MemoryBackend:
+    # Checks never wait on I/O, so async callers run them inline
+    blocking = False
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._tats: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, now: float, interval: float, window: float) -> bool:
+        with self._lock:
+            # Least recently updated first; expired ones hold no state
+            while self._tats:
+                oldest, tat = next(iter(self._tats.items()))
+                if tat > now and len(self._tats) <= self.max_keys:
+                    break
+                del self._tats[oldest]
+
+            tat = max(self._tats.get(key, now), now) + interval
+            if tat - now > window:
+                return False
+            self._tats[key] = tat
+            self._tats.move_to_end(key)
+            return True
+
+    def __len__(self):
+        return len(self._tats)
+
+
+class SQLiteBackend:
+    """Shared by processes on one host; every check is one UPSERT."""
+
+    def __init__(self, path: str = RATE_LIMIT_DB_PATH):
+        self._local = threading.local()
+        self.path = path
+        self._checks = 0
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits "
+            "(key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID"
+        )
+        db.commit()
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def acquire(self, key: str, now: float, interval: float, window: float) -> bool:
+        db = self._db()
+        # The WHERE clause rejects without writing; no row comes back then
+        row = db.execute(
+            """
+            INSERT INTO rate_limits (key, tat) VALUES (:key, :now + :interval)
+            ON CONFLICT (key) DO UPDATE
+                SET tat = MAX(tat, :now) + :interval
+                WHERE MAX(tat, :now) + :interval - :now <= :window
+            RETURNING tat
+            """,
+            {"key": key, "now": now, "interval": interval, "window": window},
+        ).fetchone()
+
+        self._checks += 1
+        if self._checks % SWEEP_EVERY == 0:
+            db.execute("DELETE FROM rate_limits WHERE tat < ?", (now,))
+        return row is not None
+
+
+_REDIS_GCRA = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now) + interval
+if tat - now > window then
+    return 0
+end
+redis.call('SET', KEYS[1], tat, 'PX', math.ceil((tat - now) * 1000))
+return 1
+"""
+
+
+class RedisBackend:
+    """Atomic GCRA in a Lua script; the key's TTL does the eviction."""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "ratelimit:"):
+        import redis  # optional dependency, only needed for this backend
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_GCRA)
+
+    def acquire(self, key: str, now: float, interval: float, window: float) -> bool:
+        return bool(
+            self._script(keys=[self.prefix + key], args=[now, interval, window])
+        )
+
+
+def make_backend(name: str = RATE_LIMIT_BACKEND):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "redis":
+        return RedisBackend()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {name}")
+
 
 class RateLimiter:
-    def __init__(self):
-        self.requests = defaultdict(list)
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else make_backend()
 
     def check(self, user_id: str, action: str):
-        now = time.time()
-        window_start = now - WINDOW_SECONDS
+        limit = RATE_LIMITS[action]
+        interval = WINDOW_SECONDS / limit
 
         key = f"{user_id}:{action}"
-        timestamps = self.requests[key]
-
-        # remove old requests
-        self.requests[key] = [ts for ts in timestamps if ts > window_start]
-
-        if len(self.requests[key]) >= RATE_LIMITS[action]:
-            return False
+        try:
+            return self.backend.acquire(key, time.time(), interval, WINDOW_SECONDS)
+        except Exception as e:
+            # A broken limiter store must not take the API down with it
+            print(f"Rate limiter backend error: {e}")
+            return True
 
-        self.requests[key].append(now)
-        return True
+    async def check_async(self, user_id: str, action: str):
+        """
+        check() for request handlers. SQLite and Redis checks can wait on
+        a lock or the network, so they run in a worker thread.
+        """
+        if not getattr(self.backend, "blocking", True):
+            return self.check(user_id, action)
+        return await asyncio.to_thread(self.check, user_id, action)
 
 
 rate_limiter = RateLimiter()
@@ -1,10 +1,32 @@
+"""
+Password hashing.
+
+bcrypt runs on its own small thread pool (bcrypt releases the GIL), so a
+burst of logins cannot starve FastAPI's shared threadpool. At most
+PASSWORD_HASH_WORKERS hashes run at once and PASSWORD_HASH_QUEUE more may
+wait; beyond that the async helpers raise HashingBusy straight away.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
 
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+
+
+class HashingBusy(Exception):
+    pass
+
 
 def hash_password(password: str) -> str:
     # bcrypt requires bytes, and returns bytes. We decode to store as string.
     pwd_bytes = password.encode("utf-8")
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(pwd_bytes, salt)
     return hashed.decode("utf-8")
 
@@ -13,3 +35,57 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     pwd_bytes = plain_password.encode("utf-8")
     hashed_bytes = hashed_password.encode("utf-8")
     return bcrypt.checkpw(pwd_bytes, hashed_bytes)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True when the hash was made with a cost other than BCRYPT_ROUNDS."""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+class _HashingPool:
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise HashingBusy("Password hashing is saturated")
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="bcrypt"
+                )
+            executor = self._executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = _HashingPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _pool.run(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _pool.run(verify_password, plain_password, hashed_password)
+
+
+def shutdown_hashing_pool():
+    _pool.shutdown()
@@ -0,0 +1,108 @@
+"""
+SimHash fingerprints for near-duplicate text detection.
+
+A fingerprint is 64 bits; two texts are near-duplicates when their
+fingerprints agree on at least `threshold` of the bits. SimHashIndex finds
+candidates by splitting fingerprints into 8 bands of 8 bits: any pair
+within 7 differing bits shares at least one band exactly.
+"""
+
+import hashlib
+import re
+
+import numpy as np
+
+BITS = 64
+BANDS = 8
+BAND_BITS = BITS // BANDS
+SHINGLE_WORDS = 3
+
+_WORD = re.compile(r"\w+")
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def shingles(text: str) -> list[str]:
+    """Lower-cased SHINGLE_WORDS-word shingles of the text."""
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return [" ".join(words)] if words else []
+    return [
+        " ".join(words[i : i + SHINGLE_WORDS])
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    ]
+
+
+def jaccard(a: str, b: str) -> float:
+    """
+    Exact shingle-set overlap of two texts. SimHash only estimates it, and
+    templated text can collide, so matches are confirmed with this.
+    """
+    first, second = set(shingles(a)), set(shingles(b))
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def simhash(text: str) -> int:
+    """Unsigned 64-bit SimHash over lower-cased word shingles."""
+    features = shingles(text)
+    if not features:
+        return 0
+
+    hashes = np.array([_feature_hash(f) for f in features], dtype=np.uint64)
+    bits = np.unpackbits(hashes.view(np.uint8), bitorder="little").reshape(-1, BITS)
+    # Bit i is set when more features have it set than not
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(features)
+    return int(np.packbits(votes, bitorder="little").view(np.uint64)[0])
+
+
+def similarity(a: int, b: int) -> float:
+    return 1.0 - (a ^ b).bit_count() / BITS
+
+
+def to_signed(fingerprint: int) -> int:
+    """SQL integer columns are signed 64-bit."""
+    return fingerprint - (1 << BITS) if fingerprint >= 1 << (BITS - 1) else fingerprint
+
+
+def to_unsigned(fingerprint: int) -> int:
+    return fingerprint + (1 << BITS) if fingerprint < 0 else fingerprint
+
+
+class SimHashIndex:
+    """Banded LSH over fingerprints; maps each fingerprint to a label."""
+
+    def __init__(self):
+        self.bands = [dict() for _ in range(BANDS)]
+        self.size = 0
+
+    @staticmethod
+    def _keys(fingerprint: int):
+        mask = (1 << BAND_BITS) - 1
+        for band in range(BANDS):
+            yield band, (fingerprint >> (band * BAND_BITS)) & mask
+
+    def add(self, fingerprint: int, label: str):
+        for band, key in self._keys(fingerprint):
+            self.bands[band].setdefault(key, []).append((fingerprint, label))
+        self.size += 1
+
+    def find(self, fingerprint: int, threshold: float, exclude=()) -> list:
+        """
+        Indexed (label, similarity) pairs at or above threshold, most
+        similar first, ignoring labels in exclude.
+        """
+        found = {}
+        for band, key in self._keys(fingerprint):
+            for candidate, label in self.bands[band].get(key, ()):
+                if label in exclude or label in found:
+                    continue
+                score = similarity(fingerprint, candidate)
+                if score >= threshold:
+                    found[label] = score
+        return sorted(found.items(), key=lambda item: item[1], reverse=True)
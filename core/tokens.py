@@ -0,0 +1,39 @@
+"""
+Token counting for OpenAI models.
+
+Uses tiktoken when it is installed and its encoding files can be loaded;
+otherwise falls back to the usual ~4 characters per token estimate.
+"""
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or no network to fetch the BPE file
+    _encoding = None
+
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, -(-len(text) // CHARS_PER_TOKEN)) if text else 0
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens."""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return _encoding.decode(tokens[:max_tokens])
+    return text[: max_tokens * CHARS_PER_TOKEN]
+
+
+def token_offsets(text: str) -> list[int]:
+    """Character offset at which each token of text starts."""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return _encoding.decode_with_offsets(tokens)[1]
+    return list(range(0, len(text), CHARS_PER_TOKEN))
@@ -1,55 +1,208 @@
+import asyncio
 import os
-# import chromadb
-# from chromadb.config import Settings
-
-from pinecone import Pinecone, ServerlessSpec
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 
+from core.lexical_index import lexical_index
+
 load_dotenv()
 
-# # Get ABSOLUTE directory safely
-# BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# DB_DIR = os.path.normpath(os.path.join(BASE_DIR, "..", "chroma_db"))
+# "pinecone" (hosted) or "local" (in-process, memory-mapped segments)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+
+INDEX_NAME = "rag-app"
+EMBEDDING_DIMENSION = 1536  # OpenAI text-embedding-3-small dimension
+
+# One Pinecone namespace per user, so queries only scan that user's vectors.
+# Off by default: existing vectors live in the default namespace. Turn it on
+# for new indexes, or once scripts/migrate_namespaces.py has moved them.
+PINECONE_NAMESPACES = os.getenv("PINECONE_NAMESPACES", "false").lower() == "true"
 
-# # Make sure directory exists
-# os.makedirs(DB_DIR, exist_ok=True)
+# Upsert batches in flight at once
+VECTOR_UPSERT_CONCURRENCY = int(os.getenv("VECTOR_UPSERT_CONCURRENCY", "4"))
 
-# client = chromadb.PersistentClient(
-#     path=DB_DIR, settings=Settings(anonymized_telemetry=False)
-# )
 
-# collection = client.get_or_create_collection(name="documents")
+class VectorBackend:
+    """
+    Interface every vector store backend implements.
+    Query results use the Pinecone shape: {"matches": [{"id", "score", "metadata"}]}.
+    """
 
-api_key = os.getenv("PINECONE_API_KEY")
+    # Vectors per upsert call; None sends everything at once
+    upsert_batch_size: int | None = None
 
-if not api_key:
-    print("❌ ERROR: PINECONE_API_KEY is not set in environment variables.")
-else:
-    print(f"✅ PINECONE_API_KEY found (starts with {api_key[:5]}...)")
+    def upsert(self, vectors: list[dict]):
+        raise NotImplementedError
 
-pc = Pinecone(api_key=api_key)
-index_name = "rag-app"
+    def query(self, vector, top_k: int, filter=None, include_values=False):
+        raise NotImplementedError
 
-# Create index if not exists (Basic check)
-existing_indexes = [i.name for i in pc.list_indexes()]
-if index_name not in existing_indexes:
-    pc.create_index(
-        name=index_name,
-        dimension=1536,  # OpenAI text-embedding-3-small dimension
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1"),
-    )
-    # Wait for index to be ready
-    while not pc.describe_index(index_name).status["ready"]:
-        time.sleep(1)
+    def delete(self, ids=None, filter=None):
+        raise NotImplementedError
 
-index = pc.Index(index_name)
+    def update_metadata(self, updates: dict[str, dict], filter=None):
+        """
+        Merge fields into the metadata of stored vectors, keyed by id. The
+        filter only narrows where to look, as for delete by id.
+        """
+        raise NotImplementedError
 
 
-def add_documents(texts, embeddings, metadatas, ids):
-    # collection.add(documents=texts, embeddings=embeddings, metadatas=metadatas, ids=ids)
+def _user_namespace(user_id) -> str:
+    return str(user_id) if user_id and PINECONE_NAMESPACES else ""
+
+
+def _split_namespace(filter) -> tuple[str, dict]:
+    """
+    The namespace a filter is pinned to by its user_id, and the rest of the
+    filter: the user_id condition is implied by the namespace.
+    """
+    filter = dict(filter or {})
+    user_id = filter.get("user_id")
+    if isinstance(user_id, dict):
+        user_id = user_id.get("$eq")
+    namespace = _user_namespace(user_id)
+    if namespace:
+        filter.pop("user_id")
+    return namespace, filter
+
+
+def _plain_match(match, include_values: bool) -> dict:
+    """A Pinecone ScoredVector as the plain dict every backend returns."""
+    plain = {
+        "id": match.id,
+        "score": match.score,
+        "metadata": dict(match.metadata or {}),
+    }
+    if include_values:
+        plain["values"] = list(match.values or [])
+    return plain
+
+
+class PineconeBackend(VectorBackend):
+    # Batch upsert is recommended (batches of 100)
+    upsert_batch_size = 100
+    # Ids per fetch call
+    fetch_batch_size = 100
+
+    def __init__(self):
+        from pinecone import Pinecone, ServerlessSpec
+
+        api_key = os.getenv("PINECONE_API_KEY")
+
+        if not api_key:
+            print("❌ ERROR: PINECONE_API_KEY is not set in environment variables.")
+        else:
+            print(f"✅ PINECONE_API_KEY found (starts with {api_key[:5]}...)")
+
+        pc = Pinecone(api_key=api_key)
+
+        # Create index if not exists (Basic check)
+        existing_indexes = [i.name for i in pc.list_indexes()]
+        if INDEX_NAME not in existing_indexes:
+            pc.create_index(
+                name=INDEX_NAME,
+                dimension=EMBEDDING_DIMENSION,
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1"),
+            )
+            # Wait for index to be ready
+            while not pc.describe_index(INDEX_NAME).status["ready"]:
+                time.sleep(1)
+
+        # Enough connections for the concurrent upserts
+        self.index = pc.Index(INDEX_NAME, pool_threads=VECTOR_UPSERT_CONCURRENCY)
+
+    def upsert(self, vectors: list[dict]):
+        groups: dict[str, list[dict]] = {}
+        for vector in vectors:
+            namespace = _user_namespace(vector["metadata"].get("user_id"))
+            groups.setdefault(namespace, []).append(vector)
+
+        for namespace, group in groups.items():
+            self.index.upsert(vectors=group, namespace=namespace)
+
+    def query(self, vector, top_k: int, filter=None, include_values=False):
+        namespace, filter = _split_namespace(filter)
+        response = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+            include_values=include_values,
+            filter=filter or None,
+            namespace=namespace,
+        )
+        return {"matches": [_plain_match(m, include_values) for m in response.matches]}
+
+    def delete(self, ids=None, filter=None):
+        namespace, filter = _split_namespace(filter)
+        if ids is not None:
+            self.index.delete(ids=ids, namespace=namespace)
+        elif not filter and namespace:
+            # Everything the user has
+            self.index.delete(delete_all=True, namespace=namespace)
+        else:
+            self.index.delete(filter=filter, namespace=namespace)
+
+    def update_metadata(self, updates: dict[str, dict], filter=None):
+        namespace, _ = _split_namespace(filter)
+        # An update call changes a single vector; re-upserting the stored
+        # values costs two calls per fetch_batch_size vectors instead
+        ids = list(updates)
+        for i in range(0, len(ids), self.fetch_batch_size):
+            fetched = self.index.fetch(
+                ids=ids[i : i + self.fetch_batch_size], namespace=namespace
+            )
+            vectors = [
+                {
+                    "id": vector_id,
+                    "values": vector.values,
+                    "metadata": {**(vector.metadata or {}), **updates[vector_id]},
+                }
+                for vector_id, vector in fetched.vectors.items()
+            ]
+            if vectors:
+                self.index.upsert(vectors=vectors, namespace=namespace)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_upsert_pool = None
+
 
+def get_backend() -> VectorBackend:
+    """Create the configured backend on first use."""
+    global _backend
+    if _backend is not None:
+        return _backend
+
+    with _backend_lock:
+        if _backend is not None:
+            return _backend
+        if VECTOR_BACKEND == "local":
+            from core.local_vectorstore import LocalVectorStore
+
+            _backend = LocalVectorStore()
+        elif VECTOR_BACKEND == "pinecone":
+            _backend = PineconeBackend()
+        else:
+            raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+    return _backend
+
+
+def _get_upsert_pool() -> ThreadPoolExecutor:
+    global _upsert_pool
+    with _backend_lock:
+        if _upsert_pool is None:
+            _upsert_pool = ThreadPoolExecutor(
+                max_workers=VECTOR_UPSERT_CONCURRENCY, thread_name_prefix="upsert"
+            )
+        return _upsert_pool
+
+
+def add_documents(texts, embeddings, metadatas, ids):
     vectors = []
     for i, text in enumerate(texts):
         # Pinecone metadata must be a dict
@@ -58,32 +211,109 @@ def add_documents(texts, embeddings, metadatas, ids):
 
         vectors.append({"id": ids[i], "values": embeddings[i], "metadata": meta})
 
-    # Batch upsert is recommended (batches of 100)
-    batch_size = 100
-    for i in range(0, len(vectors), batch_size):
-        batch = vectors[i : i + batch_size]
-        index.upsert(vectors=batch)
+    backend = get_backend()
 
+    batch_size = getattr(backend, "upsert_batch_size", None) or len(vectors) or 1
+    batches = [vectors[i : i + batch_size] for i in range(0, len(vectors), batch_size)]
+    if len(batches) == 1 or VECTOR_UPSERT_CONCURRENCY <= 1:
+        for batch in batches:
+            backend.upsert(batch)
+    else:
+        # Round trips overlap. Wait for every batch before reporting a
+        # failure, so a caller's cleanup can't race a late write
+        futures = [_get_upsert_pool().submit(backend.upsert, b) for b in batches]
+        wait(futures)
+        for future in futures:
+            future.result()
 
-def query_documents(query_embedding, n_results=3, where=None):
-    # return collection.query(
-    #     query_embeddings=[query_embedding], n_results=n_results, where=where
-    # )
+    # Keyword side of hybrid retrieval
+    lexical_index.add(ids, texts, [vector["metadata"] for vector in vectors])
 
-    # Ensure filter is not None for Pinecone if empty
-    filter_dict = where if where else {}
 
-    return index.query(
+def query_documents(query_embedding, n_results=3, where=None, include_values=False):
+    return get_backend().query(
         vector=query_embedding,
         top_k=n_results,
-        include_metadata=True,
-        filter=filter_dict,
+        filter=where,
+        include_values=include_values,
     )
 
 
-def delete_vectors(filter: dict):
+def delete_vectors(filter: dict | None = None, ids: list[str] | None = None):
     """
-    Delete vectors based on a metadata filter.
+    Delete vectors based on a metadata filter, or by id.
     Example filter: {"user_id": "123", "source": "file.pdf"}
+    With ids, the filter only narrows where to look (e.g. {"user_id": ...}).
+    """
+    backend = get_backend()
+    if ids is None:
+        backend.delete(filter=filter)
+        lexical_index.delete(filter=filter)
+        return
+
+    # Pinecone accepts at most 1000 ids per delete
+    batch_size = 1000
+    for i in range(0, len(ids), batch_size):
+        backend.delete(ids=ids[i : i + batch_size], filter=filter)
+    lexical_index.delete(ids=ids)
+
+
+def delete_matching_vectors(filter: dict, batch_size: int = 1000) -> int:
+    """
+    Delete every vector matching a metadata filter, by id. For vectors with
+    no record of their ids (stored before document_chunks existed):
+    serverless Pinecone indexes cannot delete by filter, but can query by
+    one. Returns how many were deleted.
+    """
+    probe = [1.0] + [0.0] * (EMBEDDING_DIMENSION - 1)
+    deleted = set()
+    while True:
+        matches = query_documents(probe, batch_size, where=filter)["matches"]
+        # Deletes may take a moment to show up in query results
+        ids = [match["id"] for match in matches if match["id"] not in deleted]
+        if not ids:
+            return len(deleted)
+        delete_vectors(filter={"user_id": filter.get("user_id")}, ids=ids)
+        deleted.update(ids)
+
+
+def update_metadata(updates: dict[str, dict], filter: dict | None = None):
+    """
+    Merge fields into the metadata of stored vectors without re-embedding,
+    e.g. {"<id>": {"chunk_index": 3}}. filter narrows where to look.
     """
-    index.delete(filter=filter)
+    if not updates:
+        return
+    get_backend().update_metadata(updates, filter=filter)
+    lexical_index.update_metadata(updates)
+
+
+# Async entry points for request handlers. Pinecone calls are blocking HTTP
+# and local searches are NumPy work that releases the GIL, so both run in a
+# worker thread instead of on the event loop.
+
+
+async def add_documents_async(texts, embeddings, metadatas, ids):
+    await asyncio.to_thread(add_documents, texts, embeddings, metadatas, ids)
+
+
+async def query_documents_async(
+    query_embedding, n_results=3, where=None, include_values=False
+):
+    return await asyncio.to_thread(
+        query_documents, query_embedding, n_results, where, include_values
+    )
+
+
+async def delete_vectors_async(
+    filter: dict | None = None, ids: list[str] | None = None
+):
+    await asyncio.to_thread(delete_vectors, filter, ids)
+
+
+async def delete_matching_vectors_async(filter: dict) -> int:
+    return await asyncio.to_thread(delete_matching_vectors, filter)
+
+
+async def update_metadata_async(updates: dict[str, dict], filter: dict | None = None):
+    await asyncio.to_thread(update_metadata, updates, filter)
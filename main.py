@@ -1,15 +1,28 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
 from core.database import Base, engine
-from models import user, conversation  # noqa: F401 Ensure models are loaded
+from core.migrations import add_missing_columns, add_missing_indexes, fill_nulls
+from core.answer_cache import answer_cache
+from core.embedding_cache import embedding_cache
+from models import (
+    user,
+    conversation,
+    ingest_job,
+    document_chunk,
+)  # noqa: F401 Ensure models are loaded
 from api.train import router as train_router
 from api.ask import router as ask_router
 from api.train_file import router as train_file_router
 from api.auth import router as auth_router
 from api.documents import router as documents_router
 from api.conversations import router as conversations_router
+from core.security import shutdown_hashing_pool
+from services.deletion import cancel_purges, resume_purges
+from services.file_loader import shutdown_extraction_pool
+from services.ingest import ingest_queue
 
 # Load environment variables
 load_dotenv()
@@ -17,12 +30,33 @@ load_dotenv()
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine, Base.metadata)
+add_missing_indexes(engine, Base.metadata)
+# Conversations are ordered by updated_at, which used to start out NULL
+fill_nulls(
+    engine, conversation.Conversation.updated_at, conversation.Conversation.created_at
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background workers for file ingestion; resumes unfinished jobs
+    await ingest_queue.start()
+    # Finish document deletions interrupted by the last shutdown
+    resume_purges()
+    yield
+    cancel_purges()
+    await ingest_queue.stop()
+    shutdown_extraction_pool()
+    shutdown_hashing_pool()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="RAG Backend",
     description="Knowledge-based RAG backend API",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS Middleware
@@ -36,6 +70,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Pagination of list endpoints
 )
 
 # Register routers
@@ -63,4 +98,6 @@ def health():
     return {
         "status": "ok",
         "env_loaded": bool(os.getenv("OPENAI_API_KEY")),
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
     }
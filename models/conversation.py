@@ -1,5 +1,7 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, Text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -15,7 +17,9 @@ class Conversation(Base):
         String, nullable=True
     )  # Optional title, could be auto-generated later
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )  # Last activity, used for ordering
 
     # Relationships
     user = relationship("User", back_populates="conversations")
@@ -31,7 +35,28 @@ class Message(Base):
     conversation_id = Column(String, ForeignKey("conversations.id"), nullable=False)
     role = Column(String, nullable=False)  # "user" or "assistant"
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),  # sub-second order of a pair
+        server_default=func.now(),
+    )
 
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
+
+
+# Sidebar: a user's conversations by last activity
+Index(
+    "ix_conversations_user_updated",
+    Conversation.user_id,
+    Conversation.updated_at,
+    Conversation.id,
+)
+
+# A conversation's messages in order
+Index(
+    "ix_messages_conversation_created",
+    Message.conversation_id,
+    Message.created_at,
+    Message.id,
+)
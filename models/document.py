@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from core.database import Base
 
@@ -11,4 +11,11 @@ class Document(Base):
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     filename = Column(String, nullable=False)  # For text, this can be a snippet title
     file_type = Column(String, nullable=False)  # 'pdf', 'docx', 'text'
+    content_hash = Column(String, nullable=True)  # sha256 of the last ingested upload
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    deleted_at = Column(
+        DateTime(timezone=True), nullable=True
+    )  # Tombstone: hidden, its vectors are being removed
+
+
+Index("ix_documents_user_created", Document.user_id, Document.created_at, Document.id)
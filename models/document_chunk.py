@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, BigInteger
+from sqlalchemy.sql import func
+
+from core.database import Base
+
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+
+    id = Column(String, primary_key=True)  # Same id as the vector
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    document_id = Column(String, nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    simhash = Column(BigInteger, nullable=False)  # Signed 64-bit fingerprint
+    chunk_hash = Column(String, nullable=True, index=True)  # sha256 of the text
+    token_count = Column(Integer, nullable=True)
+    ingest_job_id = Column(String, nullable=True)  # Job that stored it
+    # Near-duplicate skipped at ingestion: the chunk whose vector covers it.
+    # Such a chunk has no vector of its own.
+    duplicate_of = Column(String, nullable=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,49 @@
+import uuid
+from sqlalchemy import (
+    Column,
+    String,
+    DateTime,
+    ForeignKey,
+    Integer,
+    Text,
+    Boolean,
+    Float,
+)
+from sqlalchemy.sql import func, false
+
+from core.database import Base
+
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    document_id = Column(String, nullable=True)  # Document being built
+    filename = Column(String, nullable=False)
+    file_type = Column(String, nullable=False)
+    temp_path = Column(String, nullable=False)  # Upload waiting to be processed
+    content_hash = Column(String, nullable=True)  # sha256 of the upload
+    is_update = Column(
+        Boolean, nullable=False, default=False, server_default=false()
+    )  # Re-upload of an existing document
+    status = Column(
+        String, nullable=False, default="queued", index=True
+    )  # queued, running, completed, failed
+    owner = Column(String, nullable=True)  # Worker process running the job
+    lease_until = Column(Float, nullable=True)  # Epoch seconds the claim lapses
+    characters = Column(Integer, nullable=False, default=0)
+    chunks_total = Column(Integer, nullable=False, default=0)
+    chunks_done = Column(Integer, nullable=False, default=0)
+    chunks_skipped = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )  # Near-duplicates of chunks already stored
+    chunks_reused = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )  # Unchanged since the previous upload
+    chunks_removed = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )  # Gone since the previous upload
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
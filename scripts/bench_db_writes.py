@@ -0,0 +1,121 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+# Add backend directory to python path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from core.database import Base, create_db_engine  # noqa: E402
+from models import user, conversation  # noqa: E402,F401
+from models.conversation import Conversation, Message  # noqa: E402
+
+
+def make_engine(url: str, tuned: bool):
+    if tuned:
+        return create_db_engine(url)
+    # The previous configuration
+    return create_engine(url, connect_args={"check_same_thread": False})
+
+
+def save_messages(Session, user_id: str):
+    """Same writes as one /api/ask request."""
+    db = Session()
+    try:
+        conversation_id = str(uuid.uuid4())
+        db.add(Conversation(id=conversation_id, user_id=user_id, title="bench"))
+        db.flush()
+        db.add(Message(conversation_id=conversation_id, role="user", content="q"))
+        db.add(Message(conversation_id=conversation_id, role="assistant", content="a"))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def worker(url, tuned, threads, writes, results):
+    """One server process with its own engine and request threads."""
+    Session = sessionmaker(
+        autocommit=False, autoflush=False, bind=make_engine(url, tuned)
+    )
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def requests():
+        user_id = str(uuid.uuid4())
+        for _ in range(writes):
+            start = time.perf_counter()
+            try:
+                save_messages(Session, user_id)
+            except OperationalError as e:
+                with lock:
+                    errors.append(str(e.orig))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    pool = [threading.Thread(target=requests) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((latencies, errors))
+
+
+def run(url, tuned, processes, threads, writes):
+    Base.metadata.create_all(bind=make_engine(url, tuned))
+
+    results = multiprocessing.Queue()
+    start = time.perf_counter()
+    workers = [
+        multiprocessing.Process(
+            target=worker, args=(url, tuned, threads, writes, results)
+        )
+        for _ in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    collected = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [t for lat, _ in collected for t in lat]
+    errors = [e for _, errs in collected for e in errs]
+    ms = np.array(latencies or [0.0]) * 1000
+    print(
+        f"{'tuned' if tuned else 'default':<8} {len(latencies) / elapsed:>10.0f} "
+        f"{np.percentile(ms, 50):>8.2f} {np.percentile(ms, 99):>9.2f} "
+        f"{len(errors):>7}"
+    )
+    if errors:
+        print(f"         e.g. {errors[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Concurrent Message writes against SQLite, old vs tuned engine"
+    )
+    parser.add_argument("--processes", type=int, default=4, help="server workers")
+    parser.add_argument("--threads", type=int, default=8, help="requests per worker")
+    parser.add_argument("--writes", type=int, default=100, help="per thread")
+    args = parser.parse_args()
+
+    total = args.processes * args.threads * args.writes
+    print(f"{args.processes} processes x {args.threads} threads, {total} requests\n")
+    print(f"{'engine':<8} {'writes/s':>10} {'p50 ms':>8} {'p99 ms':>9} {'errors':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for tuned in (False, True):
+            url = f"sqlite:///{os.path.join(tmp, f'bench-{tuned}.db')}"
+            run(url, tuned, args.processes, args.threads, args.writes)
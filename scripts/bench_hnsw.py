@@ -0,0 +1,100 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add backend directory to python path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from core.hnsw import HNSWIndex  # noqa: E402
+
+
+def clustered_data(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Gaussian blobs, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    data = centers[labels] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def percentile(values, pct):
+    return float(np.percentile(values, pct)) * 1000
+
+
+def run(n, dim, queries, k, M, ef_construction, ef_values, delete_ratio):
+    data = clustered_data(n + queries, dim, clusters=max(n // 500, 8))
+    base, probes = data[:n], data[n:]
+
+    index = HNSWIndex(dim, M=M, ef_construction=ef_construction)
+    start = time.perf_counter()
+    for i, vector in enumerate(base):
+        index.add(str(i), vector)
+    build = time.perf_counter() - start
+    print(f"Built {n} x {dim} (M={M}, ef_construction={ef_construction})")
+    print(f"  {build:.1f}s total, {build / n * 1000:.2f} ms/insert")
+
+    live = np.ones(n, dtype=bool)
+    if delete_ratio:
+        rng = np.random.default_rng(1)
+        for i in rng.choice(n, int(n * delete_ratio), replace=False):
+            index.mark_deleted(str(i))
+            live[i] = False
+        print(f"  tombstoned {n - int(live.sum())} vectors")
+
+    # Exact neighbours for recall
+    scores = probes @ base.T
+    scores[:, ~live] = -np.inf
+    truth = np.argsort(-scores, axis=1)[:, :k]
+
+    exact_times = []
+    for probe in probes:
+        start = time.perf_counter()
+        s = base @ probe
+        np.argpartition(-s, k)[:k]
+        exact_times.append(time.perf_counter() - start)
+
+    print()
+    print(f"{'ef':>6} {'recall@' + str(k):>10} {'p50 ms':>8} {'p99 ms':>8}")
+    print(
+        f"{'exact':>6} {1.0:>10.3f} "
+        f"{percentile(exact_times, 50):>8.2f} {percentile(exact_times, 99):>8.2f}"
+    )
+    for ef in ef_values:
+        times, hits = [], 0
+        for probe, expected in zip(probes, truth):
+            start = time.perf_counter()
+            found = index.search(probe, k, ef=ef)
+            times.append(time.perf_counter() - start)
+            hits += len({int(label) for label, _ in found} & set(expected.tolist()))
+        recall = hits / (len(probes) * k)
+        print(
+            f"{ef:>6} {recall:>10.3f} "
+            f"{percentile(times, 50):>8.2f} {percentile(times, 99):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HNSW recall vs latency report")
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--M", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--delete-ratio", type=float, default=0.0)
+    args = parser.parse_args()
+
+    run(
+        args.n,
+        args.dim,
+        args.queries,
+        args.k,
+        args.M,
+        args.ef_construction,
+        args.ef,
+        args.delete_ratio,
+    )
@@ -0,0 +1,67 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Add backend directory to python path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from core.rate_limiter import (  # noqa: E402
+    RateLimiter,
+    MemoryBackend,
+    SQLiteBackend,
+    RedisBackend,
+    WINDOW_SECONDS,
+    RATE_LIMITS,
+)
+
+
+class SlidingWindowLimiter:
+    """The previous list-per-user limiter, for comparison."""
+
+    def __init__(self):
+        self.requests = defaultdict(list)
+
+    def check(self, user_id: str, action: str):
+        now = time.time()
+        key = f"{user_id}:{action}"
+        self.requests[key] = [t for t in self.requests[key] if now - t < WINDOW_SECONDS]
+        if len(self.requests[key]) >= RATE_LIMITS[action]:
+            return False
+        self.requests[key].append(now)
+        return True
+
+
+def run(name: str, limiter, users: list[str], checks: int):
+    rng = random.Random(0)
+    allowed = 0
+    start = time.perf_counter()
+    for _ in range(checks):
+        allowed += limiter.check(rng.choice(users), "ask")
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<16} {checks / elapsed:>12,.0f} checks/s "
+        f"{elapsed / checks * 1e6:>8.1f} us/check {allowed / checks:>8.1%} allowed"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rate limiter checks per second")
+    parser.add_argument("--checks", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--redis", action="store_true", help="also benchmark REDIS_URL")
+    args = parser.parse_args()
+
+    users = [f"user-{i}" for i in range(args.users)]
+    print(f"{args.checks} checks over {args.users} users ({RATE_LIMITS['ask']}/min)\n")
+
+    run("sliding window", SlidingWindowLimiter(), users, args.checks)
+    run("gcra memory", RateLimiter(MemoryBackend()), users, args.checks)
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(os.path.join(tmp, "rate_limits.db"))
+        run("gcra sqlite", RateLimiter(backend), users, args.checks)
+    if args.redis:
+        run("gcra redis", RateLimiter(RedisBackend()), users, args.checks)
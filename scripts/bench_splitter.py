@@ -0,0 +1,113 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add backend directory to python path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from core.tokens import count_tokens  # noqa: E402
+from services.file_loader import iter_sections_from_file  # noqa: E402
+from services.text_splitter import _hard_split, iter_chunks  # noqa: E402
+
+WORDS = (
+    "the of and to in is that for it as was with be by on not he this are or "
+    "retrieval embedding vector index chunk document paragraph sentence token "
+    "query answer context model latency throughput memory page section"
+).split()
+
+
+def split_text(text: str, chunk_size: int = 300, overlap: int = 30) -> list[str]:
+    """The fixed-size character splitter ingestion used before, as a baseline."""
+    step = chunk_size - overlap
+    return [text[start : start + chunk_size] for start in range(0, len(text), step)]
+
+
+def synthetic_text(paragraphs: int, seed: int = 0) -> str:
+    """Prose-shaped text: paragraphs of 1-12 sentences of 5-30 words."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(1, 12)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(5, 30))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        out.append(" ".join(sentences))
+    return "\n\n".join(out)
+
+
+def describe(name: str, texts: list[str], elapsed: float, characters: int):
+    tokens = [count_tokens(text) for text in texts]
+    mid_word = sum(
+        1 for text in texts if text and text[-1].isalnum() and text is not texts[-1]
+    )
+    clean_end = sum(1 for text in texts if text.rstrip().endswith((".", "!", "?")))
+    print(f"{name}")
+    print(f"  chunks:            {len(texts)}")
+    print(
+        f"  tokens/chunk:      mean {sum(tokens) / max(len(tokens), 1):.1f}, max {max(tokens, default=0)}"
+    )
+    print(f"  tokens embedded:   {sum(tokens)}")
+    print(f"  end mid-word:      {mid_word / max(len(texts), 1):.1%}")
+    print(f"  end on sentence:   {clean_end / max(len(texts), 1):.1%}")
+    print(f"  throughput:        {characters / elapsed / 1e6:.2f} MB/s")
+
+
+def check_hard_split(text: str, chunk_tokens: int):
+    """Word-boundary cuts must not lose or repeat any character."""
+    words = text.split()
+    pieces = [piece for piece, _ in _hard_split(" ".join(words), chunk_tokens)]
+    if " ".join(pieces).split() != words:
+        raise SystemExit("hard split round trip FAILED")
+    longest = max(count_tokens(piece) for piece in pieces)
+    print(f"Hard split round trip ok: {len(pieces)} pieces, max {longest} tokens\n")
+
+
+def run(sections, chunk_tokens: int, overlap_tokens: int):
+    text = "\n\n".join(section for section, _ in sections)
+    characters = len(text)
+    print(f"Input: {characters} characters, {count_tokens(text)} tokens\n")
+    check_hard_split(text[:200_000], chunk_tokens)
+
+    start = time.perf_counter()
+    old = split_text(text)
+    describe(
+        "split_text (300 chars, 30 overlap)",
+        old,
+        time.perf_counter() - start,
+        characters,
+    )
+
+    start = time.perf_counter()
+    new = [
+        chunk["text"] for chunk in iter_chunks(sections, chunk_tokens, overlap_tokens)
+    ]
+    describe(
+        f"iter_chunks ({chunk_tokens} tokens, {overlap_tokens} overlap)",
+        new,
+        time.perf_counter() - start,
+        characters,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the character splitter with the token-aware one"
+    )
+    parser.add_argument(
+        "files", nargs="*", help="txt/pdf/docx files (default: synthetic)"
+    )
+    parser.add_argument("--paragraphs", type=int, default=5000)
+    parser.add_argument("--chunk-tokens", type=int, default=256)
+    parser.add_argument("--overlap-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    if args.files:
+        sections = []
+        for path in args.files:
+            sections.extend(iter_sections_from_file(path, path.rsplit(".", 1)[-1]))
+    else:
+        sections = [(synthetic_text(args.paragraphs), None)]
+
+    run(sections, args.chunk_tokens, args.overlap_tokens)
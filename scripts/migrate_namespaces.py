@@ -0,0 +1,78 @@
+"""
+One-off move of Pinecone vectors from the default namespace into one
+namespace per user (see PINECONE_NAMESPACES in core/vectorstore.py).
+Run it with PINECONE_NAMESPACES=true, then turn the setting on for the app.
+
+Vectors are copied before they are deleted, and anything already moved is
+no longer in the default namespace, so the script can be re-run safely
+after an interruption. Vectors without a user_id stay where they are.
+"""
+
+import argparse
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add backend directory to python path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+load_dotenv()
+
+from core import vectorstore  # noqa: E402
+
+# Pinecone fetches at most 100 ids at a time
+FETCH_BATCH = 100
+
+
+def migrate(dry_run: bool):
+    if vectorstore.VECTOR_BACKEND != "pinecone":
+        print("✅ The local vector store is already partitioned per user.")
+        return
+    if not vectorstore.PINECONE_NAMESPACES:
+        print("❌ PINECONE_NAMESPACES is off; run with PINECONE_NAMESPACES=true.")
+        return
+
+    backend = vectorstore.get_backend()
+    index = backend.index
+
+    # Collect the ids first: deleting while paging would shift the pages
+    ids = [item.id for page in index.list(namespace="") for item in page.vectors]
+    print(f"Found {len(ids)} vectors in the default namespace")
+
+    moved, kept, users = 0, 0, set()
+    for i in range(0, len(ids), FETCH_BATCH):
+        fetched = index.fetch(ids=ids[i : i + FETCH_BATCH], namespace="")
+        vectors, batch_ids = [], []
+        for vector_id, vector in fetched.vectors.items():
+            metadata = dict(vector.metadata or {})
+            if not metadata.get("user_id"):
+                kept += 1
+                continue
+            vectors.append(
+                {"id": vector_id, "values": vector.values, "metadata": metadata}
+            )
+            batch_ids.append(vector_id)
+            users.add(metadata["user_id"])
+
+        if vectors and not dry_run:
+            backend.upsert(vectors)  # routed to each user's namespace
+            index.delete(ids=batch_ids, namespace="")
+        moved += len(vectors)
+        print(f"  {moved} moved, {kept} without a user_id", end="\r")
+
+    action = "Would move" if dry_run else "Moved"
+    print(f"\n✅ {action} {moved} vectors into {len(users)} user namespaces.")
+    if not dry_run:
+        print("Set PINECONE_NAMESPACES=true for the app so queries use them.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move vectors into per-user Pinecone namespaces"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="count what would move, change nothing"
+    )
+    args = parser.parse_args()
+
+    migrate(args.dry_run)
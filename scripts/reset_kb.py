@@ -8,6 +8,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 load_dotenv()
 
+from core.lexical_index import lexical_index  # noqa: E402
+
 
 def reset_pinecone():
     api_key = os.getenv("PINECONE_API_KEY")
@@ -24,8 +26,14 @@ def reset_pinecone():
 
     if confirm.lower() == "yes":
         try:
-            index.delete(delete_all=True)
+            # Every user has a namespace of their own
+            for namespace in index.describe_index_stats().namespaces:
+                index.delete(delete_all=True, namespace=namespace)
             print("✅ distinct index cleared successfully.")
+
+            # Keyword search would still return ids of the deleted vectors
+            lexical_index.clear()
+            print("✅ Lexical index cleared.")
         except Exception as e:
             print(f"❌ Error deleting index: {e}")
     else:
@@ -0,0 +1,115 @@
+"""
+Assemble the LLM context from reranked matches.
+
+Matches from the same document are put back in reading order, and
+neighbouring chunks are merged with their shared overlap removed. The
+result is capped at CONTEXT_MAX_TOKENS; when it does not all fit, the
+best-ranked passages are kept.
+"""
+
+import os
+
+from core.tokens import count_tokens, truncate_tokens
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+# Overlap looked for between neighbouring chunks; shorter shared
+# prefixes are likely coincidence
+MAX_OVERLAP_CHARS = 2000
+MIN_OVERLAP_CHARS = 8
+# A passage cut down to fewer tokens than this is left out instead
+MIN_PASSAGE_TOKENS = 50
+
+SEPARATOR = "\n\n"
+
+
+def _strip_overlap(previous: str, following: str) -> str:
+    """following without the prefix it shares with the end of previous."""
+    longest = min(len(previous), len(following), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return following[size:]
+    return following
+
+
+class _Passage:
+    def __init__(self, document_id, first: int, text: str, rank: int):
+        self.document_id = document_id
+        self.first = first  # chunk ordinal of the first chunk, for ordering
+        self.last = first
+        self.text = text
+        self.rank = rank  # best rerank position among its chunks
+
+    def extend(self, text: str, ordinal: int, rank: int):
+        rest = _strip_overlap(self.text, text)
+        joiner = "" if len(rest) < len(text) else "\n"
+        self.text = (self.text + joiner + rest).strip()
+        self.last = ordinal
+        self.rank = min(self.rank, rank)
+
+
+def _passages(matches: list[dict]) -> list[_Passage]:
+    """
+    Merge runs of consecutive chunks of the same document. A vector seen
+    twice counts once, at its best rank; distinct vectors that share an
+    ordinal are kept as separate passages.
+    """
+    by_document: dict = {}
+    loose = []
+    seen = set()
+    for rank, match in enumerate(matches):
+        meta = match["metadata"]
+        text = meta.get("text", "")
+        if not text:
+            continue
+        key = match.get("id") or text
+        if key in seen:
+            continue
+        seen.add(key)
+        if meta.get("document_id") is None or meta.get("chunk_index") is None:
+            loose.append(_Passage(None, 0, text, rank))
+            continue
+        by_document.setdefault(meta["document_id"], []).append(
+            (int(meta["chunk_index"]), rank, text)
+        )
+
+    passages = loose
+    for document_id, chunks in by_document.items():
+        chunks.sort()
+        current = None
+        for ordinal, rank, text in chunks:
+            if current is not None and ordinal == current.last + 1:
+                current.extend(text, ordinal, rank)
+            else:
+                current = _Passage(document_id, ordinal, text, rank)
+                passages.append(current)
+    return passages
+
+
+def build_context(matches: list[dict], max_tokens: int = CONTEXT_MAX_TOKENS) -> str:
+    """
+    Context text for generate_answer from matches in rerank order.
+    Documents appear in order of their best match, and each document's
+    passages in reading order.
+    """
+    passages = _passages(matches)
+
+    # Spend the budget on the best-ranked passages first
+    kept, budget = [], max_tokens
+    for passage in sorted(passages, key=lambda p: p.rank):
+        tokens = count_tokens(passage.text)
+        if tokens > budget:
+            if budget < MIN_PASSAGE_TOKENS:
+                continue
+            passage.text = truncate_tokens(passage.text, budget)
+            tokens = budget
+        kept.append(passage)
+        budget -= tokens + count_tokens(SEPARATOR)
+        if budget <= 0:
+            break
+
+    document_rank = {}
+    for passage in kept:
+        key = passage.document_id or id(passage)
+        document_rank[key] = min(document_rank.get(key, passage.rank), passage.rank)
+    kept.sort(key=lambda p: (document_rank[p.document_id or id(p)], p.first))
+    return SEPARATOR.join(passage.text for passage in kept)
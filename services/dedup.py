@@ -0,0 +1,382 @@
+"""
+Near-duplicate chunk elimination at ingestion time.
+
+Every stored chunk is recorded in document_chunks with its SimHash. Before
+a chunk is embedded it is looked up in the user's fingerprint index; a
+candidate within CHUNK_DEDUP_THRESHOLD of something the user already has
+(or of an earlier chunk of the same upload) is confirmed against that
+chunk's text by shingle Jaccard (CHUNK_DEDUP_JACCARD), and only then is
+the chunk skipped. Set the threshold above 1 to store everything.
+
+A skipped chunk is still recorded, linked to the chunk whose vector covers
+it (duplicate_of). When that vector is about to be deleted with its
+document, rehome_duplicates() gives the first linked chunk a vector of its
+own and moves the other links to it, so content another document still
+has never drops out of retrieval.
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+
+from core.database import SessionLocal
+from core.embeddings import embed_texts_async
+from core.lexical_index import lexical_index
+from core.simhash import SimHashIndex, jaccard, simhash, to_signed, to_unsigned
+from core.vectorstore import add_documents_async
+from models.document import Document
+from models.document_chunk import DocumentChunk
+
+# Fraction of the 64 fingerprint bits that must agree. The banded index
+# finds every match down to 0.89; lower values only catch some of them.
+CHUNK_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", "0.95"))
+# Shingle overlap a SimHash candidate must have to count as a duplicate
+CHUNK_DEDUP_JACCARD = float(os.getenv("CHUNK_DEDUP_JACCARD", "0.9"))
+CHUNK_DEDUP_MAX_USERS = int(os.getenv("CHUNK_DEDUP_MAX_USERS", "1000"))
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkDeduplicator:
+    def __init__(
+        self,
+        threshold: float = CHUNK_DEDUP_THRESHOLD,
+        max_users: int = CHUNK_DEDUP_MAX_USERS,
+        min_jaccard: float = CHUNK_DEDUP_JACCARD,
+    ):
+        self.threshold = threshold
+        self.max_users = max_users
+        self.min_jaccard = min_jaccard
+        self._indexes: OrderedDict[str, SimHashIndex] = OrderedDict()
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    def _index(self, user_id: str) -> SimHashIndex:
+        """
+        Fingerprints of the user's chunks that have a vector, loaded from
+        SQL on first use.
+        """
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            return index
+
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(DocumentChunk.id, DocumentChunk.simhash)
+                .filter(
+                    DocumentChunk.user_id == user_id,
+                    DocumentChunk.duplicate_of.is_(None),
+                )
+                .all()
+            )
+        finally:
+            db.close()
+
+        index = SimHashIndex()
+        for row in rows:
+            index.add(to_unsigned(row.simhash), row.id)
+        self._indexes[user_id] = index
+        while len(self._indexes) > self.max_users:
+            self._indexes.popitem(last=False)
+        return index
+
+    def _covering(self, index, text, fingerprint, exclude, recent) -> str | None:
+        """Id of a stored chunk confirmed to cover text, if any."""
+        candidates = [
+            label for label, _ in index.find(fingerprint, self.threshold, exclude)
+        ]
+        if not candidates:
+            return None
+        # Chunks of this call are not in the lexical index yet
+        texts = {label: recent[label] for label in candidates if label in recent}
+        missing = [label for label in candidates if label not in texts]
+        if missing:
+            texts.update(lexical_index.texts(missing))
+        for label in candidates:
+            if label in texts and jaccard(text, texts[label]) >= self.min_jaccard:
+                return label
+        return None
+
+    def register(
+        self,
+        user_id: str,
+        document_id: str,
+        chunks: list[dict],
+        job_id: str | None = None,
+        exclude=(),
+    ) -> tuple[list[dict], int]:
+        """
+        Give each new chunk its vector "id" and record it; drop the
+        near-duplicates, recording them linked to the chunk that covers
+        them. Stored chunks whose ids are in exclude (the old version of a
+        document being replaced) do not count as duplicates.
+        Returns (kept chunks, number skipped).
+        Blocking: call from a worker thread.
+        """
+        return self.register_many(user_id, [(document_id, chunks)], job_id, exclude)[0]
+
+    def register_many(
+        self,
+        user_id: str,
+        documents: list[tuple[str, list[dict]]],
+        job_id: str | None = None,
+        exclude=(),
+    ) -> list[tuple[list[dict], int]]:
+        """
+        register() for several (document_id, chunks) at once, recorded in
+        one transaction. Chunks of earlier documents count as duplicates
+        for later ones. Returns (kept, skipped) per document.
+        """
+        fingerprints = [
+            [simhash(chunk["text"]) for chunk in chunks] for _, chunks in documents
+        ]
+        results, rows = [], []
+
+        with self._lock:
+            index = self._index(user_id)
+            recent = {}
+            for (document_id, chunks), prints in zip(documents, fingerprints):
+                kept = []
+                for chunk, fingerprint in zip(chunks, prints):
+                    covering = None
+                    if self.threshold <= 1:
+                        covering = self._covering(
+                            index, chunk["text"], fingerprint, exclude, recent
+                        )
+                    chunk["id"] = str(uuid.uuid4())
+                    if covering is None:
+                        index.add(fingerprint, chunk["id"])
+                        recent[chunk["id"]] = chunk["text"]
+                        kept.append(chunk)
+                    rows.append(
+                        DocumentChunk(
+                            id=chunk["id"],
+                            user_id=user_id,
+                            document_id=document_id,
+                            chunk_index=chunk.get("chunk_index", 0),
+                            simhash=to_signed(fingerprint),
+                            chunk_hash=chunk_hash(chunk["text"]),
+                            token_count=chunk.get("tokens"),
+                            ingest_job_id=job_id,
+                            duplicate_of=covering,
+                        )
+                    )
+                skipped = len(chunks) - len(kept)
+                self.skipped += skipped
+                results.append((kept, skipped))
+
+        db = SessionLocal()
+        try:
+            db.add_all(rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # The in-memory index now holds chunks SQL does not; rebuild it
+            self.forget_user(user_id)
+            raise
+        finally:
+            db.close()
+
+        return results
+
+    def remove_document(self, user_id: str, document_id: str):
+        """Drop a document's chunk records, e.g. when it is deleted."""
+        db = SessionLocal()
+        try:
+            db.query(DocumentChunk).filter(
+                DocumentChunk.document_id == document_id
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self.forget_user(user_id)
+
+    def existing_chunks(self, document_id: str) -> dict[str, list[str]]:
+        """Stored chunk ids of a document, keyed by chunk_hash."""
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(DocumentChunk.id, DocumentChunk.chunk_hash)
+                .filter(DocumentChunk.document_id == document_id)
+                .all()
+            )
+        finally:
+            db.close()
+
+        by_hash = {}
+        for row in rows:
+            by_hash.setdefault(row.chunk_hash, []).append(row.id)
+        return by_hash
+
+    def moved_chunks(self, positions: dict[str, int]) -> tuple[dict, set]:
+        """
+        The subset of {chunk id: chunk_index} whose stored index differs,
+        and which of those are linked duplicates without a vector.
+        """
+        ids = list(positions)
+        db = SessionLocal()
+        try:
+            moved, linked = {}, set()
+            for i in range(0, len(ids), 500):
+                rows = (
+                    db.query(
+                        DocumentChunk.id,
+                        DocumentChunk.chunk_index,
+                        DocumentChunk.duplicate_of,
+                    )
+                    .filter(DocumentChunk.id.in_(ids[i : i + 500]))
+                    .all()
+                )
+                for row in rows:
+                    if row.chunk_index != positions[row.id]:
+                        moved[row.id] = positions[row.id]
+                        if row.duplicate_of is not None:
+                            linked.add(row.id)
+            return moved, linked
+        finally:
+            db.close()
+
+    def set_chunk_indexes(self, positions: dict[str, int]):
+        """Record new ordinals for kept chunks, e.g. after a re-upload."""
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(DocumentChunk),
+                [
+                    {"id": chunk_id, "chunk_index": index}
+                    for chunk_id, index in positions.items()
+                ],
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def job_chunk_ids(self, job_id: str) -> list[str]:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(DocumentChunk.id)
+                .filter(DocumentChunk.ingest_job_id == job_id)
+                .all()
+            )
+            return [row.id for row in rows]
+        finally:
+            db.close()
+
+    def remove_chunks(self, user_id: str, ids: list[str]):
+        """Drop the records of individual chunks."""
+        db = SessionLocal()
+        try:
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(ids), 500):
+                db.query(DocumentChunk).filter(
+                    DocumentChunk.id.in_(ids[i : i + 500])
+                ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self.forget_user(user_id)
+
+    def linked_chunks(self, ids: list[str]) -> list:
+        """
+        Chunks of live documents linked to one of ids, other than ids
+        themselves, with the filename of their document.
+        """
+        removed = set(ids)
+        db = SessionLocal()
+        try:
+            found = []
+            for i in range(0, len(ids), 500):
+                found.extend(
+                    db.query(
+                        DocumentChunk.id,
+                        DocumentChunk.document_id,
+                        DocumentChunk.chunk_index,
+                        DocumentChunk.duplicate_of,
+                        Document.filename,
+                    )
+                    .join(Document, Document.id == DocumentChunk.document_id)
+                    .filter(
+                        DocumentChunk.duplicate_of.in_(ids[i : i + 500]),
+                        Document.deleted_at.is_(None),
+                    )
+                    .all()
+                )
+            return [row for row in found if row.id not in removed]
+        finally:
+            db.close()
+
+    def relink(self, user_id: str, promoted: dict[str, str]):
+        """
+        For each {old covering id: new covering id}, move the links to the
+        new chunk, which now has a vector of its own.
+        """
+        db = SessionLocal()
+        try:
+            for old, new in promoted.items():
+                db.query(DocumentChunk).filter(
+                    DocumentChunk.duplicate_of == old, DocumentChunk.id != new
+                ).update({DocumentChunk.duplicate_of: new}, synchronize_session=False)
+                db.query(DocumentChunk).filter(DocumentChunk.id == new).update(
+                    {DocumentChunk.duplicate_of: None}, synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
+        self.forget_user(user_id)
+
+    def forget_user(self, user_id: str):
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+
+chunk_deduplicator = ChunkDeduplicator()
+
+
+async def rehome_duplicates(user_id: str, ids: list[str]):
+    """
+    Call before deleting the vectors of ids: chunks of other documents
+    linked to them get a vector of their own, embedded from the covering
+    chunk's text (near-identical by construction, and usually cached).
+    """
+    rows = await run_in_threadpool(chunk_deduplicator.linked_chunks, ids)
+    if not rows:
+        return
+
+    heirs = {}
+    for row in rows:
+        heirs.setdefault(row.duplicate_of, row)
+    texts = await run_in_threadpool(lexical_index.texts, list(heirs))
+    # Without the text there is nothing to embed: such chunks are left
+    # unlinked and without a vector
+    promoted = {old: row for old, row in heirs.items() if old in texts}
+    if promoted:
+        chunk_texts = [texts[old] for old in promoted]
+        await add_documents_async(
+            texts=chunk_texts,
+            embeddings=await embed_texts_async(chunk_texts),
+            ids=[row.id for row in promoted.values()],
+            metadatas=[
+                {
+                    "source": row.filename,
+                    "user_id": user_id,
+                    "document_id": row.document_id,
+                    "chunk_index": row.chunk_index,
+                }
+                for row in promoted.values()
+            ],
+        )
+    await run_in_threadpool(
+        chunk_deduplicator.relink,
+        user_id,
+        {old: row.id for old, row in heirs.items()},
+    )
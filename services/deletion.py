@@ -0,0 +1,163 @@
+"""
+Background deletion of documents.
+
+Deleting a document only tombstones its row (deleted_at), which hides it
+from listings, re-uploads and retrieval straight away. Its vectors are
+then removed by id, PURGE_BATCH_IDS at a time, using the chunk records in
+document_chunks, and the row goes last. Tombstoned documents left over
+from a restart are purged again on startup.
+"""
+
+import asyncio
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.sql import func
+
+from core.database import SessionLocal
+from core.vectorstore import delete_matching_vectors_async, delete_vectors_async
+from models.document import Document
+from models.document_chunk import DocumentChunk
+from models.ingest_job import IngestJob
+from services.dedup import chunk_deduplicator, rehome_duplicates
+from services.ingest import DocumentBusy
+
+# Pinecone accepts at most 1000 ids per delete
+PURGE_BATCH_IDS = 1000
+
+_purging: set[str] = set()
+_tasks: set[asyncio.Task] = set()
+
+
+def tombstone_document(user_id: str, document_id: str) -> bool:
+    """
+    Mark the document deleted. False when the user has no such live
+    document; raises DocumentBusy while an upload of it is in progress.
+    """
+    db = SessionLocal()
+    try:
+        active = (
+            db.query(IngestJob.id)
+            .filter(
+                IngestJob.document_id == document_id,
+                IngestJob.status.in_(["queued", "running"]),
+            )
+            .first()
+        )
+        if active is not None:
+            raise DocumentBusy(document_id)
+
+        updated = (
+            db.query(Document)
+            .filter(
+                Document.id == document_id,
+                Document.user_id == user_id,
+                Document.deleted_at.is_(None),
+            )
+            .update({Document.deleted_at: func.now()}, synchronize_session=False)
+        )
+        db.commit()
+        return updated > 0
+    finally:
+        db.close()
+
+
+def deleted_documents(document_ids) -> set[str]:
+    """Which of these documents are tombstoned."""
+    document_ids = list(set(document_ids))
+    if not document_ids:
+        return set()
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Document.id)
+            .filter(Document.id.in_(document_ids), Document.deleted_at.isnot(None))
+            .all()
+        )
+        return {row.id for row in rows}
+    finally:
+        db.close()
+
+
+def _chunk_ids(document_id: str, limit: int) -> list[str]:
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(DocumentChunk.id)
+            .filter(DocumentChunk.document_id == document_id)
+            .limit(limit)
+            .all()
+        )
+        return [row.id for row in rows]
+    finally:
+        db.close()
+
+
+def _tombstoned() -> list[tuple[str, str]]:
+    db = SessionLocal()
+    try:
+        return [
+            (row.user_id, row.id)
+            for row in db.query(Document.user_id, Document.id)
+            .filter(Document.deleted_at.isnot(None))
+            .all()
+        ]
+    finally:
+        db.close()
+
+
+def _delete_row(document_id: str):
+    db = SessionLocal()
+    try:
+        db.query(Document).filter(Document.id == document_id).delete(
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def purge_document(user_id: str, document_id: str):
+    """
+    Remove a tombstoned document's vectors, chunk records and row.
+    Failures are logged; the tombstone stays and the next startup retries.
+    """
+    if document_id in _purging:
+        return
+    _purging.add(document_id)
+    try:
+        removed = 0
+        while ids := await run_in_threadpool(_chunk_ids, document_id, PURGE_BATCH_IDS):
+            await rehome_duplicates(user_id, ids)
+            await delete_vectors_async(filter={"user_id": user_id}, ids=ids)
+            await run_in_threadpool(chunk_deduplicator.remove_chunks, user_id, ids)
+            removed += len(ids)
+
+        if not removed:
+            # Stored before chunks were recorded: only a filter can find them
+            await delete_matching_vectors_async(
+                {"user_id": user_id, "document_id": document_id}
+            )
+
+        await run_in_threadpool(_delete_row, document_id)
+    except Exception as e:
+        print(f"Error purging document {document_id}: {e}")
+    finally:
+        _purging.discard(document_id)
+
+
+async def _resume():
+    for user_id, document_id in await run_in_threadpool(_tombstoned):
+        await purge_document(user_id, document_id)
+
+
+def resume_purges():
+    """Purge documents a previous run tombstoned but did not finish."""
+    task = asyncio.create_task(_resume())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def cancel_purges():
+    for task in list(_tasks):
+        task.cancel()
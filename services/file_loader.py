@@ -1,25 +1,201 @@
+import multiprocessing
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
 from pypdf import PdfReader
 from docx import Document
 
+# Characters read per step from plain-text files
+TEXT_READ_SIZE = 64 * 1024
+# Longest run of plain text without a blank line kept as one section
+TEXT_MAX_SECTION = 1024 * 1024
+
+# Extraction is CPU-bound pure Python, so it runs on a process pool shared
+# by all uploads. PDFs are fanned out in page ranges.
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+PDF_PAGE_TIMEOUT_SECONDS = float(os.getenv("PDF_PAGE_TIMEOUT_SECONDS", "30"))
+# Not fork: the server has threads (threadpool, ingest and maintenance
+# workers) whose held locks a forked child would inherit
+EXTRACT_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=EXTRACT_WORKERS,
+                    mp_context=multiprocessing.get_context(EXTRACT_START_METHOD),
+                )
+    return _pool
+
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    """Drop a pool whose worker died so the next upload gets a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_extraction_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ---------- worker-side (runs in the pool processes) ----------
+
+
+class _PageTimeout(BaseException):
+    # BaseException: pypdf swallows Exception subclasses in places
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise _PageTimeout()
+
+
+@contextmanager
+def _time_limit(seconds: float):
+    # Pool tasks run on the worker's main thread, where SIGALRM is usable
+    if (
+        seconds <= 0
+        or not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _extract_pdf_range(path: str, start: int, stop: int, timeout: float) -> list[str]:
+    reader = PdfReader(path)
+    texts = []
+    for number in range(start, stop):
+        try:
+            with _time_limit(timeout):
+                texts.append(reader.pages[number].extract_text() or "")
+        except _PageTimeout:
+            print(f"Skipping page {number + 1} of {path}: extraction timed out")
+            texts.append("")
+    return texts
+
+
+def _extract_docx(path: str) -> list[str]:
+    doc = Document(path)
+    return [para.text for para in doc.paragraphs]
+
+
+# ---------- parent side ----------
+
+
+def _iter_pdf_pages(path: str):
+    """Page texts in order, extracted PDF_PAGES_PER_TASK pages per task."""
+    total = len(PdfReader(path).pages)
+    pool = _get_pool()
+    # Keep a couple of ranges per worker in flight, not the whole file
+    max_in_flight = EXTRACT_WORKERS * 2
+    pending = deque()
+    starts = iter(range(0, total, PDF_PAGES_PER_TASK))
+
+    try:
+        while True:
+            while len(pending) < max_in_flight:
+                start = next(starts, None)
+                if start is None:
+                    break
+                stop = min(start + PDF_PAGES_PER_TASK, total)
+                pending.append(
+                    pool.submit(
+                        _extract_pdf_range,
+                        path,
+                        start,
+                        stop,
+                        PDF_PAGE_TIMEOUT_SECONDS,
+                    )
+                )
+            if not pending:
+                return
+            yield from pending.popleft().result()
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _docx_paragraphs(path: str) -> list[str]:
+    pool = _get_pool()
+    try:
+        return pool.submit(_extract_docx, path).result()
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise
+
+
+def _iter_text_sections(path: str):
+    """Plain text in blocks that end on a paragraph break where possible."""
+    buffer = ""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        while piece := f.read(TEXT_READ_SIZE):
+            buffer += piece
+            cut = buffer.rfind("\n\n")
+            if cut == -1 and len(buffer) > TEXT_MAX_SECTION:
+                cut = max(buffer.rfind("\n"), buffer.rfind(" "))
+            if cut > 0:
+                yield buffer[:cut]
+                buffer = buffer[cut:]
+    if buffer:
+        yield buffer
+
 
-def extract_text_from_file(path: str, extension: str) -> str:
+def iter_sections_from_file(path: str, extension: str):
+    """
+    Yield (text, page) pairs that keep paragraphs whole: PDF pages, DOCX
+    paragraphs, or plain-text blocks cut at blank lines (or anywhere, past
+    TEXT_MAX_SECTION). page is 1-based for PDFs and None otherwise.
+    """
     extension = extension.lower()
 
     if extension == "txt":
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
+        for text in _iter_text_sections(path):
+            yield text, None
+        return
 
     if extension == "pdf":
-        reader = PdfReader(path)
-        text = []
-        for page in reader.pages:
-            page_text = page.extract_text()
+        for number, page_text in enumerate(_iter_pdf_pages(path), start=1):
             if page_text:
-                text.append(page_text)
-        return "\n".join(text)
+                yield page_text, number
+        return
 
     if extension == "docx":
-        doc = Document(path)
-        return "\n".join([para.text for para in doc.paragraphs])
+        paragraphs = _docx_paragraphs(path)
+        for text in paragraphs:
+            yield text, None
+        return
 
     raise ValueError("Unsupported file type")
@@ -0,0 +1,686 @@
+"""
+Background ingestion of uploaded files.
+
+Uploads are stored under UPLOAD_DIR and recorded as IngestJob rows; a small
+pool of asyncio workers extracts, splits, embeds and upserts them. Job state
+lives in SQL, so after a restart queued jobs are picked up again and jobs
+that were mid-flight are rolled back and re-run from the start.
+"""
+
+import asyncio
+import itertools
+import os
+import socket
+import time
+import uuid
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_
+from sqlalchemy.sql import func
+
+from core.answer_cache import answer_cache
+from core.database import SessionLocal
+from core.embeddings import embed_texts_async
+from core.vectorstore import (
+    add_documents_async,
+    delete_matching_vectors_async,
+    delete_vectors_async,
+    update_metadata_async,
+)
+from models.document import Document
+from models.ingest_job import IngestJob
+from services.dedup import chunk_deduplicator, chunk_hash, rehome_duplicates
+from services.file_loader import iter_sections_from_file
+from services.text_splitter import iter_chunks
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+
+# Chunks embedded and upserted per step; progress is reported per step
+INGEST_BATCH_CHUNKS = 256
+# Batches buffered between pipeline stages; bounds memory per job
+INGEST_PIPELINE_DEPTH = 2
+# A running job belongs to one worker process until its lease lapses; the
+# lease is renewed every third of this while the job runs
+INGEST_LEASE_SECONDS = int(os.getenv("INGEST_LEASE_SECONDS", "120"))
+
+# Identifies this process in IngestJob.owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_DONE = object()
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class DocumentUnchanged(Exception):
+    """The upload is identical to what is already stored."""
+
+    def __init__(self, document_id: str):
+        super().__init__(document_id)
+        self.document_id = document_id
+
+
+class DocumentBusy(Exception):
+    """An earlier upload of the same file is still being processed."""
+
+
+class LeaseLost(Exception):
+    """Another worker took the job over after this one's lease lapsed."""
+
+
+# ---------- job state (sync, run in the threadpool) ----------
+
+
+def _load_job(job_id: str):
+    db = SessionLocal()
+    try:
+        return db.query(IngestJob).filter(IngestJob.id == job_id).first()
+    finally:
+        db.close()
+
+
+def _update_job(job_id: str, **fields):
+    db = SessionLocal()
+    try:
+        db.query(IngestJob).filter(IngestJob.id == job_id).update(
+            fields, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _new_owner() -> str:
+    # Unique per claim, so a worker never mistakes a later claim for its own
+    return f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+
+
+def _claim_job(job_id: str) -> str | None:
+    """
+    Take a queued job. Returns the owner token for the lease, or None when
+    someone else has it.
+    """
+    owner = _new_owner()
+    db = SessionLocal()
+    try:
+        claimed = (
+            db.query(IngestJob)
+            .filter(IngestJob.id == job_id, IngestJob.status == "queued")
+            .update(
+                {
+                    IngestJob.status: "running",
+                    IngestJob.owner: owner,
+                    IngestJob.lease_until: time.time() + INGEST_LEASE_SECONDS,
+                    IngestJob.chunks_done: 0,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return owner if claimed == 1 else None
+    finally:
+        db.close()
+
+
+def _renew_lease(job_id: str, owner: str) -> bool:
+    db = SessionLocal()
+    try:
+        renewed = (
+            db.query(IngestJob)
+            .filter(
+                IngestJob.id == job_id,
+                IngestJob.owner == owner,
+                IngestJob.status == "running",
+            )
+            .update(
+                {IngestJob.lease_until: time.time() + INGEST_LEASE_SECONDS},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return renewed == 1
+    finally:
+        db.close()
+
+
+def _claim_abandoned(job_id: str) -> bool:
+    """Take over a running job whose owner let its lease lapse."""
+    now = time.time()
+    db = SessionLocal()
+    try:
+        claimed = (
+            db.query(IngestJob)
+            .filter(
+                IngestJob.id == job_id,
+                IngestJob.status == "running",
+                or_(IngestJob.lease_until.is_(None), IngestJob.lease_until < now),
+            )
+            .update(
+                {
+                    IngestJob.owner: _new_owner(),
+                    IngestJob.lease_until: now + INGEST_LEASE_SECONDS,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return claimed == 1
+    finally:
+        db.close()
+
+
+def _pending_job_ids() -> list[tuple[str, str]]:
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(IngestJob.id, IngestJob.status)
+            .filter(IngestJob.status.in_(["queued", "running"]))
+            .order_by(IngestJob.created_at)
+            .all()
+        )
+        return [(row.id, row.status) for row in rows]
+    finally:
+        db.close()
+
+
+def _set_content_hash(document_id: str, content_hash: str | None):
+    db = SessionLocal()
+    try:
+        db.query(Document).filter(Document.id == document_id).update(
+            {Document.content_hash: content_hash}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _delete_document(document_id: str):
+    db = SessionLocal()
+    try:
+        db.query(Document).filter(Document.id == document_id).delete(
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _tombstone_document(document_id: str):
+    db = SessionLocal()
+    try:
+        db.query(Document).filter(Document.id == document_id).update(
+            {Document.deleted_at: func.now()}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _remove_upload(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def create_job(
+    user_id: str,
+    filename: str,
+    file_type: str,
+    temp_path: str,
+    content_hash: str | None = None,
+) -> IngestJob:
+    """
+    Create the Document and its IngestJob in one transaction.
+    The document shows up in listings right away; its vectors follow.
+
+    A re-upload of a filename the user already has updates that document
+    instead. Raises DocumentUnchanged when the content hash matches the
+    stored one, DocumentBusy while the previous upload is still queued.
+    """
+    db = SessionLocal()
+    try:
+        document = (
+            db.query(Document)
+            .filter(
+                Document.user_id == user_id,
+                Document.filename == filename,
+                Document.deleted_at.is_(None),
+            )
+            .order_by(Document.created_at.desc())
+            .first()
+        )
+        is_update = document is not None
+        if is_update:
+            active = (
+                db.query(IngestJob.id)
+                .filter(
+                    IngestJob.document_id == document.id,
+                    IngestJob.status.in_(["queued", "running"]),
+                )
+                .first()
+            )
+            if active is not None:
+                raise DocumentBusy(document.id)
+            if content_hash and document.content_hash == content_hash:
+                raise DocumentUnchanged(document.id)
+        else:
+            document = Document(user_id=user_id, filename=filename, file_type=file_type)
+            db.add(document)
+            db.flush()
+
+        job = IngestJob(
+            user_id=user_id,
+            document_id=document.id,
+            filename=filename,
+            file_type=file_type,
+            temp_path=temp_path,
+            content_hash=content_hash,
+            is_update=is_update,
+            status="queued",
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# ---------- processing ----------
+
+
+async def _discard_vectors(job: IngestJob):
+    """
+    Remove whatever a failed or interrupted run managed to store. Only this
+    run's chunks go, so a failed re-upload leaves the previous version
+    searchable.
+    """
+    ids = await run_in_threadpool(chunk_deduplicator.job_chunk_ids, job.id)
+    if ids:
+        await rehome_duplicates(job.user_id, ids)
+        await delete_vectors_async(filter={"user_id": job.user_id}, ids=ids)
+        await run_in_threadpool(chunk_deduplicator.remove_chunks, job.user_id, ids)
+
+
+class _Progress:
+    """Counters shared by the pipeline stages of one job."""
+
+    def __init__(self):
+        self.characters = 0
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.chunks_skipped = 0
+        self.chunks_reused = 0
+        self.chunks_removed = 0
+        self.has_text = False
+
+    def count(self, sections):
+        for text, page in sections:
+            self.characters += len(text)
+            if not self.has_text and text.strip():
+                self.has_text = True
+            yield text, page
+
+
+def _position(chunk: dict) -> dict:
+    """Where a chunk sits in its file, as stored in vector metadata."""
+    return {
+        key: chunk[key] for key in ("chunk_index", "paragraph", "page") if key in chunk
+    }
+
+
+def _take(chunks, n: int) -> list[dict]:
+    return list(itertools.islice(chunks, n))
+
+
+class _Lease:
+    """Keeps a claimed job's lease fresh; check() raises once it is lost."""
+
+    def __init__(self, job_id: str, owner: str):
+        self.job_id = job_id
+        self.owner = owner
+        self.lost = False
+        self._task = asyncio.create_task(self._renew())
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(INGEST_LEASE_SECONDS / 3)
+            try:
+                held = await run_in_threadpool(_renew_lease, self.job_id, self.owner)
+            except Exception as e:
+                print(f"Error renewing lease of ingest job {self.job_id}: {e}")
+                continue
+            if not held:
+                self.lost = True
+                return
+
+    def check(self):
+        if self.lost:
+            raise LeaseLost(self.job_id)
+
+    def release(self):
+        self._task.cancel()
+
+
+async def process_job(job_id: str):
+    """
+    Extract → split → embed → upsert as three concurrent stages joined by
+    bounded queues. Only a few batches are in flight at a time, so memory
+    stays flat regardless of file size and embedding overlaps extraction.
+
+    For a re-upload, chunks whose text hash matches a stored chunk of the
+    document keep their vectors and are renumbered if they moved; stored
+    chunks that no longer appear are deleted once the new version is in.
+
+    The job is claimed first, so a job queued by several workers runs once.
+    """
+    try:
+        owner = await run_in_threadpool(_claim_job, job_id)
+    except Exception as e:
+        # Still queued; the next recovery picks it up
+        print(f"Error claiming ingest job {job_id}: {e}")
+        return
+    if owner is None:
+        return
+
+    lease = _Lease(job_id, owner)
+    try:
+        await _ingest(await run_in_threadpool(_load_job, job_id), lease)
+    finally:
+        lease.release()
+
+
+async def _ingest(job: IngestJob, lease: _Lease):
+    job_id = job.id
+    if not os.path.exists(job.temp_path):
+        raise ValueError("Upload was lost before processing finished")
+
+    old_chunks = {}
+    if job.is_update:
+        old_chunks = await run_in_threadpool(
+            chunk_deduplicator.existing_chunks, job.document_id
+        )
+        if not old_chunks:
+            # Stored before chunks were recorded: nothing to diff against
+            await delete_matching_vectors_async(
+                {"user_id": job.user_id, "document_id": job.document_id}
+            )
+    old_ids = frozenset(vector_id for ids in old_chunks.values() for vector_id in ids)
+    # Kept chunks by vector id, to renumber once the new version is in
+    reused = {}
+
+    progress = _Progress()
+    chunks = iter_chunks(
+        progress.count(iter_sections_from_file(job.temp_path, job.file_type))
+    )
+    to_embed = asyncio.Queue(maxsize=INGEST_PIPELINE_DEPTH)
+    to_upsert = asyncio.Queue(maxsize=INGEST_PIPELINE_DEPTH)
+
+    async def read():
+        # Extraction is blocking (pypdf, docx); pull one batch per thread hop
+        while batch := await run_in_threadpool(_take, chunks, INGEST_BATCH_CHUNKS):
+            lease.check()
+            progress.chunks_total += len(batch)
+            if old_chunks:
+                fresh = []
+                for chunk in batch:
+                    same = old_chunks.get(chunk_hash(chunk["text"]))
+                    if same:
+                        # Unchanged: keep the stored vector
+                        reused[same.pop()] = chunk
+                    else:
+                        fresh.append(chunk)
+                progress.chunks_reused += len(batch) - len(fresh)
+                progress.chunks_done += len(batch) - len(fresh)
+                batch = fresh
+
+            batch, skipped = await run_in_threadpool(
+                chunk_deduplicator.register,
+                job.user_id,
+                job.document_id,
+                batch,
+                job.id,
+                old_ids,
+            )
+            progress.chunks_skipped += skipped
+            progress.chunks_done += skipped
+            if batch:
+                await to_embed.put(batch)
+        await to_embed.put(_DONE)
+
+    async def embed():
+        while (batch := await to_embed.get()) is not _DONE:
+            texts = [chunk["text"] for chunk in batch]
+            await to_upsert.put((batch, await embed_texts_async(texts)))
+        await to_upsert.put(_DONE)
+
+    async def upsert():
+        while (item := await to_upsert.get()) is not _DONE:
+            lease.check()
+            batch, embeddings = item
+            ids = [chunk["id"] for chunk in batch]
+            metadatas = [
+                {
+                    "source": job.filename,
+                    "user_id": job.user_id,
+                    "document_id": job.document_id,  # Link to SQL Doc
+                    **{
+                        key: value
+                        for key, value in chunk.items()
+                        if key not in ("id", "text", "tokens")
+                    },
+                }
+                for chunk in batch
+            ]
+            await add_documents_async(
+                texts=[chunk["text"] for chunk in batch],
+                embeddings=embeddings,
+                ids=ids,
+                metadatas=metadatas,
+            )
+            progress.chunks_done += len(batch)
+            await run_in_threadpool(
+                _update_job,
+                job_id,
+                characters=progress.characters,
+                chunks_total=progress.chunks_total,
+                chunks_done=progress.chunks_done,
+                chunks_skipped=progress.chunks_skipped,
+                chunks_reused=progress.chunks_reused,
+            )
+
+    stages = [asyncio.create_task(stage()) for stage in (read, embed, upsert)]
+    try:
+        await asyncio.gather(*stages)
+    except BaseException:
+        for task in stages:
+            task.cancel()
+        await asyncio.gather(*stages, return_exceptions=True)
+        raise
+
+    if not progress.has_text:
+        raise ValueError("File is empty")
+    lease.check()
+
+    # Kept chunks may sit elsewhere in the new version; update where they
+    # are without re-embedding them
+    moved, linked = await run_in_threadpool(
+        chunk_deduplicator.moved_chunks,
+        {vector_id: chunk["chunk_index"] for vector_id, chunk in reused.items()},
+    )
+    if moved:
+        await update_metadata_async(
+            {
+                vector_id: _position(reused[vector_id])
+                for vector_id in moved
+                if vector_id not in linked
+            },
+            filter={"user_id": job.user_id},
+        )
+        await run_in_threadpool(chunk_deduplicator.set_chunk_indexes, moved)
+
+    # Whatever was not matched by the new version is gone from the file
+    removed = [vector_id for ids in old_chunks.values() for vector_id in ids]
+    if removed:
+        await rehome_duplicates(job.user_id, removed)
+        await delete_vectors_async(filter={"user_id": job.user_id}, ids=removed)
+        await run_in_threadpool(chunk_deduplicator.remove_chunks, job.user_id, removed)
+    progress.chunks_removed = len(removed)
+    await run_in_threadpool(_set_content_hash, job.document_id, job.content_hash)
+
+    await run_in_threadpool(
+        _update_job,
+        job_id,
+        status="completed",
+        characters=progress.characters,
+        chunks_total=progress.chunks_total,
+        chunks_done=progress.chunks_total,
+        chunks_skipped=progress.chunks_skipped,
+        chunks_reused=progress.chunks_reused,
+        chunks_removed=progress.chunks_removed,
+    )
+    # Cached answers may be missing the new knowledge
+    answer_cache.invalidate_user(job.user_id)
+    await run_in_threadpool(_remove_upload, job.temp_path)
+
+
+async def fail_job(job_id: str, error: str):
+    """
+    Mark a job failed and leave nothing half-ingested behind: partial
+    vectors, the placeholder Document row and the upload are removed. A
+    failed re-upload leaves the previous version in place. If the vectors
+    cannot be removed yet, a new document is tombstoned instead so the
+    startup purge finishes the job.
+    """
+    print(f"Ingest job {job_id} failed: {error}")
+    job = await run_in_threadpool(_load_job, job_id)
+    if job is None:
+        return
+
+    try:
+        await _discard_vectors(job)
+    except Exception as e:
+        print(f"Error cleaning up ingest job {job_id}: {e}")
+        if job.document_id and not job.is_update:
+            # Hidden now; the purge on next startup removes what is left
+            await run_in_threadpool(_tombstone_document, job.document_id)
+    else:
+        if job.document_id and not job.is_update:
+            await run_in_threadpool(_delete_document, job.document_id)
+
+    await run_in_threadpool(_update_job, job_id, status="failed", error=error)
+    await run_in_threadpool(_remove_upload, job.temp_path)
+
+
+# ---------- worker pool ----------
+
+
+class IngestQueue:
+    def __init__(self, workers: int = INGEST_WORKERS, maxsize: int = INGEST_QUEUE_SIZE):
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue = None
+        self._tasks = []
+        self._queued: set[str] = set()  # job ids waiting in _queue
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._recover()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def full(self) -> bool:
+        return self._queue is None or self._queue.full()
+
+    def submit(self, job_id: str):
+        if self._queue is None:
+            raise QueueFullError("Ingestion workers are not running")
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            raise QueueFullError("Ingestion queue is full")
+        self._queued.add(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await process_job(job_id)
+            except asyncio.CancelledError:
+                # Shutting down: the lease lapses and another worker, or
+                # this one after a restart, redoes the job
+                raise
+            except LeaseLost:
+                # The new owner has rolled the job back and redoes it
+                print(f"Lost the lease on ingest job {job_id}; stopped")
+            except Exception as e:
+                try:
+                    await fail_job(job_id, str(e) or e.__class__.__name__)
+                except Exception as cleanup_error:
+                    print(f"Error failing ingest job {job_id}: {cleanup_error}")
+            finally:
+                self._queue.task_done()
+
+    async def _recover(self):
+        """
+        Every INGEST_LEASE_SECONDS, requeue queued jobs and running jobs
+        whose owner's lease lapsed (a worker that died or was stopped
+        mid-run). Jobs other live workers hold are left alone; a job
+        queued by several workers is only claimed once.
+        """
+        while True:
+            await self._recover_once()
+            await asyncio.sleep(INGEST_LEASE_SECONDS)
+
+    async def _recover_once(self):
+        try:
+            pending = await run_in_threadpool(_pending_job_ids)
+        except Exception as e:
+            print(f"Error loading pending ingest jobs: {e}")
+            return
+
+        requeued = 0
+        for job_id, status in pending:
+            if job_id in self._queued:
+                continue
+            if status == "running":
+                if not await run_in_threadpool(_claim_abandoned, job_id):
+                    continue
+                # Interrupted mid-upsert: start over from a clean slate
+                job = await run_in_threadpool(_load_job, job_id)
+                try:
+                    await _discard_vectors(job)
+                except Exception as e:
+                    await fail_job(job_id, f"Could not roll back partial run: {e}")
+                    continue
+                await run_in_threadpool(
+                    _update_job,
+                    job_id,
+                    status="queued",
+                    chunks_done=0,
+                    owner=None,
+                    lease_until=None,
+                )
+
+            # Blocks while the queue is full instead of dropping jobs
+            self._queued.add(job_id)
+            await self._queue.put(job_id)
+            requeued += 1
+
+        if requeued:
+            print(f"Requeued {requeued} pending ingest job(s)")
+
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,154 @@
+"""
+Rerank stage between retrieval and answer generation.
+
+Retrieval over-fetches RERANK_CANDIDATES matches; the reranker rescores
+them against the question, drops those under RERANK_MIN_SCORE and picks a
+diverse top RERANK_TOP_K with Maximal Marginal Relevance, so overlapping
+chunks do not all end up in the prompt. RERANKER selects the
+implementation ("mmr", or "none" to keep retrieval order).
+"""
+
+import os
+import re
+
+import numpy as np
+
+from core.embedding_cache import embedding_cache
+from core.embeddings import EMBEDDING_MODEL
+
+RERANKER = os.getenv("RERANKER", "mmr").lower()
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "6"))
+RERANK_MIN_SCORE = float(os.getenv("RERANK_MIN_SCORE", "0.2"))
+# Relevance vs. novelty trade-off; 1.0 is plain relevance order
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Candidates at least this similar to an already selected chunk are dropped
+RERANK_MAX_SIMILARITY = float(os.getenv("RERANK_MAX_SIMILARITY", "0.95"))
+# Weight of embedding similarity vs. keyword overlap in relevance
+RERANK_EMBEDDING_WEIGHT = 0.8
+
+_TERM = re.compile(r"\w+")
+
+
+def _terms(text: str) -> set[str]:
+    return {term for term in _TERM.findall(text.lower()) if len(term) > 2}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class Reranker:
+    def rerank(self, question: str, query_embedding, matches: list[dict]) -> list[dict]:
+        raise NotImplementedError
+
+
+class PassthroughReranker(Reranker):
+    def __init__(self, top_k: int = RERANK_TOP_K):
+        self.top_k = top_k
+
+    def rerank(self, question, query_embedding, matches):
+        return matches[: self.top_k]
+
+
+class MMRReranker(Reranker):
+    """
+    Relevance is cosine similarity to the question embedding blended with
+    keyword overlap; redundancy is cosine similarity between chunks, or
+    term overlap for chunks whose vector is not at hand.
+    """
+
+    def __init__(
+        self,
+        top_k: int = RERANK_TOP_K,
+        min_score: float = RERANK_MIN_SCORE,
+        mmr_lambda: float = MMR_LAMBDA,
+        max_similarity: float = RERANK_MAX_SIMILARITY,
+    ):
+        self.top_k = top_k
+        self.min_score = min_score
+        self.mmr_lambda = mmr_lambda
+        self.max_similarity = max_similarity
+
+    @staticmethod
+    def _vectors(matches: list[dict]) -> list:
+        """Match vectors: from the query, else from the embedding cache."""
+        vectors = [match.get("values") or None for match in matches]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            texts = [matches[i]["metadata"].get("text", "") for i in missing]
+            for i, vector in zip(
+                missing, embedding_cache.get_many(EMBEDDING_MODEL, texts)
+            ):
+                vectors[i] = vector
+        return vectors
+
+    def rerank(self, question, query_embedding, matches):
+        if not matches:
+            return []
+
+        texts = [match["metadata"].get("text", "") for match in matches]
+        terms = [_terms(text) for text in texts]
+        question_terms = _terms(question)
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        vectors = self._vectors(matches)
+        have = np.array([vector is not None for vector in vectors])
+        matrix = np.zeros((len(matches), query.shape[0]), dtype=np.float32)
+        for i, vector in enumerate(vectors):
+            if vector is not None:
+                matrix[i] = vector
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+        overlap = np.array(
+            [
+                len(question_terms & t) / len(question_terms) if question_terms else 0.0
+                for t in terms
+            ]
+        )
+        cosine = matrix @ query
+        relevance = np.where(
+            have,
+            RERANK_EMBEDDING_WEIGHT * cosine + (1 - RERANK_EMBEDDING_WEIGHT) * overlap,
+            overlap,
+        )
+
+        # Pairwise redundancy: cosine where both vectors exist, else Jaccard
+        similarity = matrix @ matrix.T
+        for i in np.flatnonzero(~have):
+            for j in range(len(matches)):
+                similarity[i, j] = similarity[j, i] = _jaccard(terms[i], terms[j])
+
+        candidates = [
+            i for i in np.argsort(-relevance) if relevance[i] >= self.min_score
+        ]
+        if not candidates:
+            # Keep the single best match rather than answer from nothing
+            candidates = [int(np.argmax(relevance))]
+
+        selected = []
+        closest = np.zeros(len(matches))  # max similarity to anything selected
+        while candidates and len(selected) < self.top_k:
+            best = max(
+                candidates,
+                key=lambda i: self.mmr_lambda * relevance[i]
+                - (1 - self.mmr_lambda) * closest[i],
+            )
+            candidates.remove(best)
+            selected.append(best)
+            closest = np.maximum(closest, similarity[best])
+            candidates = [i for i in candidates if closest[i] < self.max_similarity]
+
+        return [{**matches[i], "rerank_score": float(relevance[i])} for i in selected]
+
+
+def get_reranker() -> Reranker:
+    if RERANKER == "none":
+        return PassthroughReranker()
+    if RERANKER == "mmr":
+        return MMRReranker()
+    raise ValueError(f"Unknown RERANKER: {RERANKER}")
+
+
+reranker = get_reranker()
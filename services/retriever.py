@@ -0,0 +1,70 @@
+"""
+Hybrid retrieval for /api/ask.
+
+Vector similarity and BM25 keyword search (core.lexical_index) run
+concurrently; their rankings are merged with reciprocal rank fusion, so
+exact identifiers and names are found without a second, wider query.
+"""
+
+import asyncio
+import os
+
+from core.lexical_index import lexical_index
+from core.vectorstore import query_documents_async
+
+# Rank damping constant from the original RRF paper
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Matches fetched from each side before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+
+def reciprocal_rank_fusion(rankings: dict[str, list[dict]], k: int = HYBRID_RRF_K):
+    """
+    Merge ranked match lists: each match scores sum(1 / (k + rank)) over
+    the lists it appears in. The per-list score is kept as "<name>_score".
+    """
+    fused = {}
+    for name, matches in rankings.items():
+        for rank, match in enumerate(matches, start=1):
+            entry = fused.get(match["id"])
+            if entry is None:
+                entry = fused[match["id"]] = {**match, "score": 0.0}
+            entry["score"] += 1.0 / (k + rank)
+            entry[f"{name}_score"] = match["score"]
+    return sorted(fused.values(), key=lambda m: m["score"], reverse=True)
+
+
+async def _lexical_search(user_id: str, question: str, top_k: int) -> dict:
+    try:
+        return await asyncio.to_thread(lexical_index.search, user_id, question, top_k)
+    except Exception as e:
+        # Keyword search is an enhancement; vector results still stand
+        print(f"Error searching lexical index: {e}")
+        return {"matches": []}
+
+
+async def hybrid_search(
+    question: str,
+    query_embedding,
+    user_id: str,
+    top_k: int = 6,
+    candidates: int = HYBRID_CANDIDATES,
+    include_values: bool = False,
+) -> dict:
+    """
+    Top fused matches, in the query_documents result shape. With
+    include_values, matches found by vector search carry their "values".
+    """
+    vector_results, lexical_results = await asyncio.gather(
+        query_documents_async(
+            query_embedding=query_embedding,
+            n_results=max(candidates, top_k),
+            where={"user_id": user_id},
+            include_values=include_values,
+        ),
+        _lexical_search(user_id, question, max(candidates, top_k)),
+    )
+    fused = reciprocal_rank_fusion(
+        {"vector": vector_results["matches"], "lexical": lexical_results["matches"]}
+    )
+    return {"matches": fused[:top_k]}
@@ -1,17 +1,152 @@
-def split_text(text: str, chunk_size: int = 300, overlap: int = 30):
-    """Split text into chunks of a specified size with overlap."""
+import os
+import re
+from bisect import bisect_right
 
-    if chunk_size < overlap:
+from core.tokens import count_tokens, token_offsets
+
+# Target size of a chunk, and how much of a paragraph that had to be cut
+# mid-way is repeated at the start of the next chunk
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+
+def _hard_split(text: str, max_tokens: int):
+    """
+    Cut a run of text with no sentence breaks at word boundaries. Every
+    character ends up in exactly one piece (bar the whitespace at a cut).
+    """
+    offsets = token_offsets(text)
+    begin = 0
+    while begin < len(text):
+        # Token the piece starts in; a cut can fall inside a token
+        first = max(bisect_right(offsets, begin) - 1, 0)
+        last = first + max_tokens
+        cut = offsets[last] if last < len(offsets) else len(text)
+        if cut < len(text):
+            space = text.rfind(" ", begin, cut)
+            if space > begin:
+                cut = space
+
+        piece = text[begin:cut].strip()
+        if piece:
+            yield piece, count_tokens(piece)
+        begin = cut
+
+
+def _pieces(paragraph: str, max_tokens: int):
+    """(text, tokens) for each sentence, hard-splitting oversized ones."""
+    for sentence in _SENTENCE_BREAK.split(paragraph):
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            yield sentence, tokens
+        else:
+            yield from _hard_split(sentence, max_tokens)
+
+
+class _Packer:
+    def __init__(self, max_tokens: int, overlap_tokens: int):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.parts = []  # (text, tokens, paragraph, page)
+        self.tokens = 0
+        self.index = 0
+
+    def fits(self, tokens: int) -> bool:
+        return self.tokens + tokens <= self.max_tokens
+
+    def add(self, text: str, tokens: int, paragraph: int, page):
+        self.parts.append((text, tokens, paragraph, page))
+        self.tokens += tokens
+
+    def clear(self):
+        self.parts = []
+        self.tokens = 0
+
+    def flush(self, carry_paragraph: int | None = None) -> dict | None:
+        """
+        Emit the current chunk. With carry_paragraph, the trailing parts
+        of that paragraph (up to overlap_tokens) seed the next chunk.
+        """
+        if not self.parts:
+            return None
+
+        _, _, paragraph, page = self.parts[0]
+        chunk = {
+            "text": "".join(part[0] for part in self.parts).strip(),
+            "chunk_index": self.index,
+            "paragraph": paragraph,
+            "tokens": self.tokens,
+        }
+        if page is not None:
+            chunk["page"] = page
+        self.index += 1
+
+        carry, carried = [], 0
+        if carry_paragraph is not None:
+            for part in reversed(self.parts):
+                if (
+                    part[2] != carry_paragraph
+                    or carried + part[1] > self.overlap_tokens
+                ):
+                    break
+                carry.append(part)
+                carried += part[1]
+        self.parts = carry[::-1]
+        self.tokens = carried
+        return chunk
+
+
+def iter_chunks(
+    sections,
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+):
+    """
+    Token-sized chunks that keep paragraphs, then sentences, then words
+    together where they fit.
+
+    sections is an iterable of (text, page) pairs, page being None for
+    formats without pages; a section never shares a paragraph with the
+    next one. Yields {"text", "chunk_index", "paragraph", "page", "tokens"}
+    dicts, where paragraph (1-based, counted across the file) and page
+    (1-based, omitted when unknown) locate the start of the chunk and
+    tokens is the sum of its pieces' counts. Each token is
+    counted a bounded number of times, so this is linear in the input.
+    """
+    if overlap_tokens >= max_tokens:
         raise ValueError("Chunk size must be greater than overlap.")
 
-    chunks = []
-    start = 0
-    text_length = len(text)
+    packer = _Packer(max_tokens, overlap_tokens)
+    paragraph = 0
+
+    for text, page in sections:
+        for block in _PARAGRAPH_BREAK.split(text):
+            block = block.strip()
+            if not block:
+                continue
+            paragraph += 1
+
+            tokens = count_tokens(block)
+            if tokens <= max_tokens:
+                if not packer.fits(tokens):
+                    yield packer.flush()
+                packer.add("\n\n" + block, tokens, paragraph, page)
+                continue
 
-    while start < text_length:
-        end = min(start + chunk_size, text_length)
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
+            # Paragraph too big for one chunk: pack it sentence by sentence
+            prefix = "\n\n"
+            for piece, piece_tokens in _pieces(block, max_tokens):
+                if not packer.fits(piece_tokens):
+                    carry = paragraph if prefix == " " else None
+                    yield packer.flush(carry)
+                    if not packer.fits(piece_tokens):
+                        packer.clear()  # overlap would not leave room
+                packer.add(prefix + piece, piece_tokens, paragraph, page)
+                prefix = " "
 
-    return chunks
+    chunk = packer.flush()
+    if chunk is not None:
+        yield chunk
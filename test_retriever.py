@@ -0,0 +1,34 @@
+from pinecone import QueryResponse, ScoredVector
+
+from core.vectorstore import PineconeBackend
+from services.retriever import reciprocal_rank_fusion
+
+
+class FakeIndex:
+    """Answers queries with the Pinecone SDK's own response objects."""
+
+    def query(self, **kwargs):
+        return QueryResponse(
+            matches=[
+                ScoredVector(id="a", score=0.9, metadata={"text": "alpha"}),
+                ScoredVector(id="b", score=0.8, metadata={"text": "beta"}),
+            ]
+        )
+
+
+def test_fusion_on_pinecone_matches():
+    backend = PineconeBackend.__new__(PineconeBackend)
+    backend.index = FakeIndex()
+
+    vector = backend.query([0.1] * 4, top_k=2, filter={"user_id": "u1"})
+    lexical = [{"id": "b", "score": 3.0, "metadata": {"text": "beta"}}]
+    fused = reciprocal_rank_fusion({"vector": vector["matches"], "lexical": lexical})
+
+    assert [match["id"] for match in fused] == ["b", "a"]
+    assert fused[0]["metadata"] == {"text": "beta"}
+    assert fused[0]["vector_score"] == 0.8 and fused[0]["lexical_score"] == 3.0
+
+
+if __name__ == "__main__":
+    test_fusion_on_pinecone_matches()
+    print("ok")
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import tempfile
+
+_dir = tempfile.mkdtemp()
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["DATABASE_URL"] = f"sqlite:///{_dir}/app.db"
+os.environ["VECTOR_BACKEND"] = "local"
+
+import api.train as train  # noqa: E402
+import services.deletion as deletion  # noqa: E402
+from core.database import Base, SessionLocal, engine  # noqa: E402
+from core.deps import Principal  # noqa: E402
+from models import conversation, ingest_job, user  # noqa: E402,F401
+from models.document import Document  # noqa: E402
+from models.document_chunk import DocumentChunk  # noqa: E402
+
+Base.metadata.create_all(bind=engine)
+
+USER = Principal(id="u1", name="U", email="u@example.com")
+TEXTS = [
+    "Alpha paragraph about the first topic in some detail.",
+    "Beta paragraph about a second, unrelated topic.",
+]
+
+
+def test_failed_batch_removes_stored_vectors(monkeypatch):
+    stored = {}
+
+    async def fake_embed(texts):
+        return [[0.1] * 4 for _ in texts]
+
+    async def add_then_fail(texts, embeddings, metadatas, ids):
+        # The first upsert batch lands, the second one fails
+        stored.update(zip(ids[:1], texts[:1]))
+        raise RuntimeError("upsert failed")
+
+    async def fake_delete(filter=None, ids=None):
+        for id in ids:
+            stored.pop(id, None)
+
+    async def fake_read_batch(request):
+        return TEXTS, []
+
+    async def allow(*args):
+        return True
+
+    monkeypatch.setattr(train, "_read_batch", fake_read_batch)
+    monkeypatch.setattr(train.rate_limiter, "check_async", allow)
+    monkeypatch.setattr(train, "embed_texts_async", fake_embed)
+    monkeypatch.setattr(train, "add_documents_async", add_then_fail)
+    monkeypatch.setattr(deletion, "delete_vectors_async", fake_delete)
+
+    result = asyncio.run(train.train_batch(None, current_user=USER))
+
+    assert [item["error"] for item in result["texts"]] == [
+        "Failed to store embeddings"
+    ] * 2
+    assert stored == {}
+    db = SessionLocal()
+    try:
+        assert db.query(Document).filter(Document.user_id == USER.id).count() == 0
+        assert db.query(DocumentChunk).count() == 0
+    finally:
+        db.close()